@@ -0,0 +1,212 @@
+"""Кэширование справочников, рецептов и связей пользователей."""
+import hashlib
+from array import array
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Favorite, Follow, Purchase, Tag
+from recipes.versions import bump_version, get_version
+
+TAGS_STATE_KEY = 'api:tags:state'
+# Сброс из сигнала виден только воркерам с общим кэшем, с локальным
+# кэшем процесса состояние устаревает не дольше чем на этот срок.
+TAGS_STATE_TIMEOUT = 60
+TAGS_DATA_KEY = 'api:tags:{etag}:{key}'
+TAGS_DATA_TIMEOUT = 60 * 60 * 24
+RECIPES_VERSION_KEY = 'api:recipes:version'
+RECIPE_DATA_KEY = 'api:recipe:{id}:{updated_at}:{version}:{variant}'
+RECIPE_DATA_TIMEOUT = 60 * 60 * 24
+INTERACTIONS_VERSION_KEY = 'api:interactions:{user_id}:version'
+INTERACTIONS_KEY = 'api:interactions:{user_id}:{version}'
+# Страховка для изменений в обход API, например из shell.
+INTERACTIONS_TIMEOUT = 60 * 60
+
+
+def make_etag(*parts):
+    return '"{}"'.format(hashlib.md5(
+        ':'.join(map(str, parts)).encode()
+    ).hexdigest())
+
+
+def get_tags_state():
+    """ETag и время изменения тэгов, без запроса при попадании.
+
+    Кроме общих значений для списка хранит время изменения каждого
+    тэга: тэгов немного, а карточка тэга не должна устаревать от
+    правки соседних.
+    """
+    state = cache.get(TAGS_STATE_KEY)
+    if state is None:
+        tags = {
+            str(tag_id): updated_at
+            for tag_id, updated_at in Tag.objects.order_by().values_list(
+                'id', 'updated_at',
+            )
+        }
+        last_modified = max(tags.values(), default=None)
+        state = {
+            'etag': make_etag(
+                len(tags), last_modified and last_modified.isoformat(),
+            ),
+            'last_modified': last_modified,
+            'tags': tags,
+        }
+        cache.set(TAGS_STATE_KEY, state, timeout=TAGS_STATE_TIMEOUT)
+    return state
+
+
+def tags_etag(request, *args, **kwargs):
+    return get_tags_state()['etag']
+
+
+def tags_last_modified(request, *args, **kwargs):
+    return get_tags_state()['last_modified']
+
+
+def tag_last_modified(request, pk, *args, **kwargs):
+    return get_tags_state()['tags'].get(str(pk))
+
+
+def tag_etag(request, pk, *args, **kwargs):
+    """ETag одного тэга, None для несуществующего."""
+    last_modified = tag_last_modified(request, pk)
+    if last_modified is None:
+        return None
+    return make_etag(pk, last_modified.isoformat())
+
+
+def get_tags_data(key, build, etag=None):
+    """Сериализованные тэги из кэша, актуальные для ETag.
+
+    По умолчанию данные привязаны к ETag списка тэгов.
+    """
+    cache_key = TAGS_DATA_KEY.format(
+        etag=etag or get_tags_state()['etag'], key=key,
+    )
+    data = cache.get(cache_key)
+    if data is None:
+        data = build()
+        cache.set(cache_key, data, timeout=TAGS_DATA_TIMEOUT)
+    return data
+
+
+def invalidate_tags():
+    cache.delete(TAGS_STATE_KEY)
+
+
+def get_recipes_version():
+    """Общая версия кэша рецептов, меняется при правке справочников."""
+    return get_version(RECIPES_VERSION_KEY)
+
+
+def bump_recipes_version():
+    bump_version(RECIPES_VERSION_KEY)
+
+
+def get_recipes_data(recipes, variant, build):
+    """Общая для всех пользователей часть рецептов одним get_many.
+
+    Ключ включает ``updated_at`` рецепта и общую версию, поэтому
+    устаревшие записи не удаляются, а перестают запрашиваться.
+    ``build(recipes)`` сериализует рецепты, которых нет в кэше.
+    """
+    version = get_recipes_version()
+    keys = [
+        RECIPE_DATA_KEY.format(
+            id=recipe.id,
+            updated_at=recipe.updated_at.timestamp(),
+            version=version,
+            variant=variant,
+        )
+        for recipe in recipes
+    ]
+    data = cache.get_many(keys)
+    missing = [
+        (key, recipe) for key, recipe in zip(keys, recipes)
+        if key not in data
+    ]
+    if missing:
+        built = dict(zip(
+            [key for key, _ in missing],
+            build([recipe for _, recipe in missing]),
+        ))
+        cache.set_many(built, timeout=RECIPE_DATA_TIMEOUT)
+        data.update(built)
+    return [data[key] for key in keys]
+
+
+class Interactions(NamedTuple):
+    """Избранное, корзина и подписки пользователя."""
+
+    favorites: frozenset
+    purchases: frozenset
+    follows: frozenset
+
+
+NO_INTERACTIONS = Interactions(frozenset(), frozenset(), frozenset())
+
+
+def pack_ids(ids):
+    """Сортированный массив 8-байтовых id вместо pickle множества."""
+    return array('q', sorted(ids)).tobytes()
+
+
+def unpack_ids(data):
+    ids = array('q')
+    ids.frombytes(data)
+    return frozenset(ids)
+
+
+def get_user_interactions(user_id):
+    """Связи пользователя из общего кэша, тремя запросами при промахе.
+
+    Версия читается до запросов к базе, поэтому данные, загруженные
+    параллельно с записью, сохраняются под уже устаревшим ключом.
+    """
+    version = get_version(INTERACTIONS_VERSION_KEY.format(user_id=user_id))
+    key = INTERACTIONS_KEY.format(user_id=user_id, version=version)
+    data = cache.get(key)
+    if data is not None:
+        return Interactions(*map(unpack_ids, data))
+    interactions = Interactions(
+        favorites=frozenset(Favorite.objects.filter(
+            user_id=user_id,
+        ).values_list('recipes_id', flat=True)),
+        purchases=frozenset(Purchase.objects.filter(
+            user_id=user_id,
+        ).values_list('recipes_id', flat=True)),
+        follows=frozenset(Follow.objects.filter(
+            user_id=user_id,
+        ).values_list('following_id', flat=True)),
+    )
+    cache.set(
+        key, tuple(map(pack_ids, interactions)),
+        timeout=INTERACTIONS_TIMEOUT,
+    )
+    return interactions
+
+
+def get_interactions(request):
+    """Связи текущего пользователя, загружаются один раз за запрос."""
+    if request is None or request.user.is_anonymous:
+        return NO_INTERACTIONS
+    interactions = getattr(request, '_interactions', None)
+    if interactions is None:
+        interactions = get_user_interactions(request.user.id)
+        request._interactions = interactions
+    return interactions
+
+
+def invalidate_interactions(user_id):
+    bump_version(INTERACTIONS_VERSION_KEY.format(user_id=user_id))
+
+
+def interactions_changed(request):
+    """После коммита сбрасывает связи пользователя во всех воркерах."""
+    def reset():
+        invalidate_interactions(request.user.id)
+        request._interactions = None
+
+    transaction.on_commit(reset)
@@ -0,0 +1,112 @@
+"""Потоковая выгрузка списка покупок в разных форматах."""
+import csv
+import json
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.loaders import Echo
+
+CART_TITLE = 'Список покупок'
+CART_FILENAME = 'список_покупок'
+CHUNK_SIZE = 64 * 1024
+
+
+def cart_rows(cart_data):
+    """Построчно читает агрегированную корзину из базы."""
+    for item in cart_data.iterator():
+        yield (
+            item['ingredients__name'],
+            item['ingredients__measurement_unit'],
+            item['amount'],
+        )
+
+
+def export_txt(cart_data):
+    yield f'{CART_TITLE}\n'
+    for name, measurement_unit, amount in cart_rows(cart_data):
+        yield f'{name} ({measurement_unit}) - {amount}\n'
+
+
+def export_csv(cart_data):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in cart_rows(cart_data):
+        yield writer.writerow(row)
+
+
+def export_json(cart_data):
+    separator = ''
+    yield '['
+    for name, measurement_unit, amount in cart_rows(cart_data):
+        yield separator + json.dumps(
+            {
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            },
+            ensure_ascii=False,
+        )
+        separator = ', '
+    yield ']'
+
+
+def get_pdf_font():
+    """Регистрирует шрифт с кириллицей из SHOPPING_CART_PDF_FONT.
+
+    Встроенные шрифты PDF кириллицу не отображают, поэтому без файла
+    шрифта выгрузка в PDF не работает.
+    """
+    font_path = settings.SHOPPING_CART_PDF_FONT
+    if not font_path or not os.path.exists(font_path):
+        raise ImproperlyConfigured(
+            f'Не найден шрифт для PDF: {font_path!r}. '
+            'Укажите TTF с кириллицей в SHOPPING_CART_PDF_FONT.'
+        )
+    font_name = os.path.splitext(os.path.basename(font_path))[0]
+    if font_name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+    return font_name
+
+
+def export_pdf(cart_data):
+    # Шрифт проверяется до начала ответа, а не посреди потока.
+    return render_pdf(cart_data, get_pdf_font())
+
+
+def render_pdf(cart_data, font):
+    width, height = A4
+    margin, line_height = 50, 18
+    with SpooledTemporaryFile(max_size=CHUNK_SIZE * 16) as buffer:
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        pdf.setFont(font, 16)
+        pdf.drawString(margin, height - margin, CART_TITLE)
+        y = height - margin - line_height * 2
+        pdf.setFont(font, 12)
+        for name, measurement_unit, amount in cart_rows(cart_data):
+            if y < margin:
+                pdf.showPage()
+                pdf.setFont(font, 12)
+                y = height - margin
+            pdf.drawString(
+                margin, y, f'{name} ({measurement_unit}) - {amount}'
+            )
+            y -= line_height
+        pdf.save()
+        buffer.seek(0)
+        while chunk := buffer.read(CHUNK_SIZE):
+            yield chunk
+
+
+EXPORTERS = {
+    'txt': (export_txt, 'text/plain; charset=utf-8'),
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'json': (export_json, 'application/json; charset=utf-8'),
+    'pdf': (export_pdf, 'application/pdf'),
+}
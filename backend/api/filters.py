@@ -1,11 +1,46 @@
+from django.conf import settings
+from django.db.models.functions import Lower
 from rest_framework import filters
 from django_filters.rest_framework import FilterSet, filters as filter
 
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Tag, Recipe
 
 
-class IngredientFilter(filters.SearchFilter):
+class IngredientFilter(filters.BaseFilterBackend):
+    """Поиск ингредиентов: сначала по началу названия, затем по вхождению.
+
+    Вхождение ищется только для запросов от ``substring_min_length``
+    символов: GIN-индекс по триграммам короче не используется, и поиск
+    превращается в чтение всего справочника.
+    """
+
     search_param = 'name'
+    max_results = 50
+    substring_min_length = 3
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip().lower()
+        if not name or view.action != 'list':
+            return queryset
+        substring = len(name) >= self.substring_min_length
+        if settings.INGREDIENT_INDEX_ENABLED:
+            return ingredient_index.search(
+                name, self.max_results, substring=substring,
+            )
+        queryset = queryset.annotate(
+            name_lower=Lower('name'),
+        ).order_by('name_lower')
+        results = list(
+            queryset.filter(name_lower__startswith=name)[:self.max_results]
+        )
+        if substring and len(results) < self.max_results:
+            results += queryset.filter(
+                name_lower__contains=name,
+            ).exclude(
+                name_lower__startswith=name,
+            )[:self.max_results - len(results)]
+        return results
 
 
 class TagFilter(FilterSet):
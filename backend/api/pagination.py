@@ -1,5 +1,137 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class Pagination(pagination.PageNumberPagination):
+    """Постраничная пагинация с опциональным режимом курсора.
+
+    Режим курсора включается параметром ``cursor`` (пустым для первой
+    страницы) и листает по ключу ``view.cursor_ordering`` без COUNT и OFFSET.
+    Размер страницы по умолчанию и максимальный можно переопределить
+    атрибутами ``page_size`` и ``max_page_size`` представления; превышающий
+    максимум ``limit`` урезается, о чем сообщает заголовок ответа.
+    """
+
     page_size_query_param = 'limit'
+    max_page_size = 100
+    page_size_clamped_header = 'X-Page-Size-Clamped'
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-id',)
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.view = view
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        ordering = getattr(view, 'cursor_ordering', self.cursor_ordering)
+        queryset = queryset.order_by(*ordering)
+        position = self.decode_cursor(request, queryset.model, ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(ordering, position)
+            )
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                getattr(page[-1], field.lstrip('-')) for field in ordering
+            ]
+        return page
+
+    def get_page_size(self, request):
+        self.page_size_clamped = False
+        page_size = getattr(self.view, 'page_size', self.page_size)
+        max_page_size = getattr(
+            self.view, 'max_page_size', self.max_page_size
+        )
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        if requested <= 0:
+            return page_size
+        if requested > max_page_size:
+            self.page_size_clamped = True
+            return max_page_size
+        return requested
+
+    def get_keyset_filter(self, ordering, position):
+        """Условие «строго после позиции» для лексикографического ключа."""
+        first_field = ordering[0]
+        bound = 'lte' if first_field.startswith('-') else 'gte'
+        keyset_filter = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            keyset_filter |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return Q(**{f'{first_field.lstrip("-")}__{bound}': position[0]}) & (
+            keyset_filter
+        )
+
+    def decode_cursor(self, request, model, ordering):
+        """Позиция из курсора, значения приводятся к типам полей ключа."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(ordering, position)
+            ]
+        except (DjangoValidationError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(
+            position, default=lambda value: value.isoformat(),
+        ).encode()).decode()
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            response = super().get_paginated_response(data)
+        else:
+            response = Response({
+                'next': self.get_next_link(),
+                'results': data,
+            })
+        if self.page_size_clamped:
+            response[self.page_size_clamped_header] = str(
+                self.get_page_size(self.request)
+            )
+        return response
@@ -1,16 +1,26 @@
-import base64
+from collections import Counter
 
 import webcolors
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
-from django.db import transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser import serializers as djoser_serializers
 from rest_framework import serializers
 
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.images import validate_dimensions
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCartItem, Tag)
+
+from .caching import get_interactions, get_recipes_data
+from .uploads import decode_base64_image
 
 User = get_user_model()
 
+RECIPES_LIMIT_MAX = 50
+BATCH_IDS_MAX = 100
+
 
 class DjoserUserCreateSerializer(djoser_serializers.UserCreateSerializer):
     """Сериализатор для списка пользователя через джосер."""
@@ -45,24 +55,54 @@ class GetUserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Функция получения статуса подписки."""
-        if self.context['request'] is None or (
-            self.context['request'].user.is_anonymous
-        ):
-            return False
-        current_user = self.context['request'].user
-        is_subscribed = obj.following.filter(user=current_user).exists()
-        return is_subscribed
+        interactions = get_interactions(self.context.get('request'))
+        return obj.id in interactions.follows
 
 
 class Base64ImageFieldSerializer(serializers.ImageField):
-    """Сериализатор изображения в base64."""
+    """Сериализатор изображения в base64.
+
+    Файл сохраняется под именем из хеша содержимого, в ответе отдается
+    размер ``rendition`` из настроек или оригинал, пока размер не готов.
+    """
+
+    def __init__(self, rendition='full', **kwargs):
+        self.rendition = rendition
+        super().__init__(**kwargs)
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+            return decode_base64_image(data)
+        file = super().to_internal_value(data)
+        try:
+            validate_dimensions(*file.image.size)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        return file
+
+    def get_attribute(self, instance):
+        rendition = self.context.get('image_rendition', self.rendition)
+        return instance.get_image(rendition)
+
+
+class RecipeImagesField(serializers.Field):
+    """Ссылки на все размеры фотографии рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return {}
+        request = self.context.get('request')
+        images = {}
+        for rendition in settings.RECIPE_IMAGE_RENDITIONS:
+            url = recipe.get_image(rendition).url
+            images[rendition] = (
+                request.build_absolute_uri(url) if request else url
+            )
+        return images
 
 
 class Hex2NameColorSerializer(serializers.Field):
@@ -126,18 +166,46 @@ class TagIDSerializer(serializers.ModelSerializer):
         fields = ('id',)
 
 
+class RecipeAuthorSerializer(serializers.ModelSerializer):
+    """Автор рецепта без статуса подписки, он зависит от пользователя."""
+
+    class Meta:
+        model = User
+        fields = (
+            'id',
+            'email',
+            'username',
+            'first_name',
+            'last_name',
+        )
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: общая часть страницы одним запросом к кэшу."""
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        return self.child.represent(list(data))
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор модели Рецепт LIST запросы."""
+    """Сериализатор модели Рецепт LIST запросы.
+
+    Общая для всех пользователей часть кэшируется по id и ``updated_at``
+    рецепта, флаги пользователя добавляются поверх нее из его связей.
+    """
 
     tags = TagSerializer(many=True)
-    author = GetUserSerializer(read_only=True)
+    author = RecipeAuthorSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
         many=True,
         source='recipe_ingredients',
     )
-    image = Base64ImageFieldSerializer(required=False, allow_null=True)
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    image = Base64ImageFieldSerializer(
+        rendition='medium', required=False, allow_null=True,
+    )
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
@@ -146,31 +214,58 @@ class RecipeSerializer(serializers.ModelSerializer):
             'author',
             'name',
             'image',
+            'images',
             'text',
             'ingredients',
             'tags',
             'cooking_time',
-            'is_favorited',
-            'is_in_shopping_cart',
         )
+        list_serializer_class = RecipeListSerializer
 
-    def get_is_favorited(self, obj):
-        if self.context['request'] is None or (
-            self.context['request'].user.is_anonymous
-        ):
-            return False
-        user = self.context['request'].user
-        is_favorited = obj.favorites.filter(user=user).exists()
-        return is_favorited
-
-    def get_is_in_shopping_cart(self, obj):
-        if self.context['request'] is None or (
-            self.context['request'].user.is_anonymous
-        ):
-            return False
-        user = self.context['request'].user
-        is_in_shopping_cart = obj.purchases.filter(user=user).exists()
-        return is_in_shopping_cart
+    def to_representation(self, instance):
+        return self.represent([instance])[0]
+
+    def represent(self, recipes):
+        request = self.context.get('request')
+        variant = '{}:{}'.format(
+            self.context.get('image_rendition', 'medium'),
+            request.build_absolute_uri('/') if request else '',
+        )
+        interactions = get_interactions(request)
+        return [
+            {
+                **data,
+                'author': {
+                    **data['author'],
+                    'is_subscribed': (
+                        recipe.author_id in interactions.follows
+                    ),
+                },
+                'is_favorited': recipe.id in interactions.favorites,
+                'is_in_shopping_cart': recipe.id in interactions.purchases,
+            }
+            for recipe, data in zip(
+                recipes, get_recipes_data(recipes, variant, self.build),
+            )
+        ]
+
+    def build(self, recipes):
+        """Общая часть рецептов, которых не оказалось в кэше."""
+        prefetch_related_objects(
+            recipes,
+            'author',
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredients'
+                ),
+            ),
+        )
+        return [
+            super(RecipeSerializer, self).to_representation(recipe)
+            for recipe in recipes
+        ]
 
 
 class CreateIngredientFromRecipeSerializer(serializers.ModelSerializer):
@@ -206,36 +301,85 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         )
 
     def validate_ingredients(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        ingredients_array = []
-        for ingredient in ingredients:
-            amount = ingredient['amount']
-            if int(amount) < 1:
+        ingredients_ids = set()
+        for ingredient in data:
+            if ingredient['amount'] < 1:
                 raise serializers.ValidationError({
                     'amount': 'Количество не может быть меньше 1'
                 })
-            if ingredient['id'] in ingredients_array:
+            if ingredient['id'] in ingredients_ids:
                 raise serializers.ValidationError({
                     'ingredient': 'Ингредиенты не дублируются'
                 })
-            ingredients_array.append(ingredient['id'])
+            ingredients_ids.add(ingredient['id'])
+        existing_ids = set(
+            Ingredient.objects.filter(
+                id__in=ingredients_ids,
+            ).values_list('id', flat=True)
+        )
+        missing_ids = sorted(ingredients_ids - existing_ids)
+        if missing_ids:
+            raise serializers.ValidationError({
+                'ingredient': 'Ингредиенты не существуют: {}'.format(
+                    ', '.join(map(str, missing_ids))
+                )
+            })
         return data
 
     def create_and_update_logic(self, ingredients_data, recipe):
-        recipe_ingredients = []
-        for ingredient_data in ingredients_data:
-            amount = ingredient_data['amount']
-            ingredient_id = ingredient_data['id']
-            recipe_ingredients.append(
-                RecipeIngredient(
-                    ingredients=Ingredient.objects.get(
-                        id=ingredient_id
-                    ),
-                    recipes=recipe,
-                    amount=amount
-                ),
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                ingredients_id=ingredient_data['id'],
+                recipes=recipe,
+                amount=ingredient_data['amount'],
+            )
+            for ingredient_data in ingredients_data
+        )
+
+    def update_ingredients_logic(self, ingredients_data, recipe):
+        """Обновляет только изменившиеся ингредиенты рецепта."""
+        amounts = {
+            ingredient_data['id']: ingredient_data['amount']
+            for ingredient_data in ingredients_data
+        }
+        existing = {
+            recipe_ingredient.ingredients_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        }
+        cart_deltas = Counter({
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        })
+        removed_ids = []
+        changed = []
+        for ingredient_id, recipe_ingredient in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is None:
+                cart_deltas[ingredient_id] -= recipe_ingredient.amount
+                removed_ids.append(recipe_ingredient.id)
+            elif recipe_ingredient.amount != amount:
+                cart_deltas[ingredient_id] += (
+                    amount - recipe_ingredient.amount
+                )
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        RecipeIngredient.objects.delete_rows(removed_ids)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        self.create_and_update_logic(
+            [
+                ingredient_data for ingredient_data in ingredients_data
+                if ingredient_data['id'] not in existing
+            ],
+            recipe,
+        )
+        if any(cart_deltas.values()):
+            ShoppingCartItem.objects.add_recipe(
+                recipe,
+                recipe.purchases.values_list('user_id', flat=True),
+                amounts=cart_deltas,
             )
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
     @transaction.atomic
     def create(self, validated_data):
@@ -250,33 +394,57 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
+        ingredients_data = validated_data.pop('ingredients', None)
+        tags_data = validated_data.pop('tags', None)
         if tags_data is not None:
-            instance.tags.clear()
             instance.tags.set(tags_data)
         if ingredients_data is not None:
-            instance.ingredients.clear()
-            self.create_and_update_logic(
-                ingredients_data,
-                recipe=instance,
-            )
+            self.update_ingredients_logic(ingredients_data, instance)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         serializer = RecipeSerializer(
             instance,
-            context={'request': self.context.get('request')},
+            context={
+                'request': self.context.get('request'),
+                'image_rendition': 'full',
+            },
         )
         return serializer.data
 
 
 class NotDetailRecipeSerializer(serializers.ModelSerializer):
-    image = serializers.ImageField(required=False)
+    image = Base64ImageFieldSerializer(rendition='thumbnail', read_only=True)
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'images', 'cooking_time']
+
+
+class RecipesLimitSerializer(serializers.Serializer):
+    """Валидация параметра recipes_limit."""
+
+    recipes_limit = serializers.IntegerField(
+        min_value=1,
+        default=RECIPES_LIMIT_MAX,
+    )
+
+    def validate_recipes_limit(self, value):
+        return min(value, RECIPES_LIMIT_MAX)
+
+
+class BatchIdsSerializer(serializers.Serializer):
+    """Список id для пакетных операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_IDS_MAX,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
 
 
 class FollowSerializer(GetUserSerializer):
@@ -292,16 +460,24 @@ class FollowSerializer(GetUserSerializer):
         )
 
     def get_recipes_count(self, obj):
-        # recipe_count = Recipe.objects.filter(author=obj).count()
-        # return recipe_count
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit is None:
+                limit_serializer = RecipesLimitSerializer(
+                    data=self.context['request'].query_params,
+                )
+                limit_serializer.is_valid(raise_exception=True)
+                recipes_limit = limit_serializer.validated_data[
+                    'recipes_limit'
+                ]
+            recipes = obj.recipes.all()[:recipes_limit]
         serializer = NotDetailRecipeSerializer(
             recipes,
             many=True,
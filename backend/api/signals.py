@@ -0,0 +1,54 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Favorite, Follow, Ingredient, Purchase, Tag
+
+from .caching import (bump_recipes_version, invalidate_interactions,
+                      invalidate_tags)
+from .serializers import RecipeAuthorSerializer
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags_cache(sender, **kwargs):
+    """Сбрасывает кэш ответов тэгов после сохранения или удаления."""
+    transaction.on_commit(invalidate_tags)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_recipes_cache(sender, **kwargs):
+    """Теги и ингредиенты входят в кэш многих рецептов сразу."""
+    transaction.on_commit(bump_recipes_version)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(sender, created, update_fields, **kwargs):
+    """Профиль автора входит в кэш его рецептов.
+
+    Сохранения только служебных полей, например ``last_login``
+    при входе, кэш не сбрасывают.
+    """
+    if created:
+        return
+    if update_fields is not None and not set(update_fields) & set(
+        RecipeAuthorSerializer.Meta.fields,
+    ):
+        return
+    transaction.on_commit(bump_recipes_version)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=Follow)
+def invalidate_user_interactions(sender, instance, **kwargs):
+    """Связи, созданные в обход API, например в админке."""
+    transaction.on_commit(partial(invalidate_interactions, instance.user_id))
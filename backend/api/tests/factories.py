@@ -0,0 +1,72 @@
+"""Общие данные для тестов и замеров."""
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+PASSWORD = 'pass'
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password=PASSWORD,
+    )
+
+
+def create_reader_and_author():
+    """Пользователь, который читает ленту, и автор рецептов."""
+    return create_user('reader'), create_user('author')
+
+
+def create_tags(count):
+    return [
+        Tag.objects.create(
+            name=f'tag{number}', color=f'#{number:06X}', slug=f'tag{number}',
+        )
+        for number in range(count)
+    ]
+
+
+def create_ingredients(count):
+    return Ingredient.objects.bulk_create(
+        Ingredient(name=f'ingredient{number}', measurement_unit='г')
+        for number in range(count)
+    )
+
+
+def create_recipe(author, name='recipe', ingredients=(), tags=(), amount=10):
+    """Рецепт с ингредиентами в одинаковом количестве и тегами."""
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='text', cooking_time=5,
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipes=recipe, ingredients=ingredient,
+                         amount=amount)
+        for ingredient in ingredients
+    )
+    if tags:
+        recipe.tags.set(tags)
+    return recipe
+
+
+def create_recipes(author, count, batch_size=None):
+    """Рецепты без состава одним bulk_create, сигналы не вызываются."""
+    return Recipe.objects.bulk_create(
+        (
+            Recipe(author=author, name=f'recipe{number}', text='text',
+                   cooking_time=5)
+            for number in range(count)
+        ),
+        batch_size=batch_size,
+    )
+
+
+def api_client(user=None):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
@@ -0,0 +1,43 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from recipes.models import Ingredient
+
+from .factories import api_client
+
+NAMES = ('Кокос', 'Молоко', 'Яблоко', 'Коржик', 'Окорок')
+
+
+class IngredientSearchTest(TestCase):
+    """Поиск ингредиентов в базе и во встроенном индексе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in NAMES
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = api_client()
+
+    def search(self, name):
+        results = {}
+        for enabled in (False, True):
+            with self.settings(INGREDIENT_INDEX_ENABLED=enabled):
+                response = self.client.get('/api/ingredients/', {'name': name})
+            self.assertEqual(response.status_code, 200)
+            results[enabled] = [item['name'] for item in response.data]
+        self.assertEqual(results[False], results[True])
+        return results[False]
+
+    def test_prefix_matches_come_first(self):
+        self.assertEqual(self.search('кок'), ['Кокос'])
+        self.assertEqual(
+            self.search('око'), ['Окорок', 'Кокос', 'Молоко', 'Яблоко'],
+        )
+        self.assertEqual(self.search('кор'), ['Коржик', 'Окорок'])
+
+    def test_short_query_matches_prefix_only(self):
+        self.assertEqual(self.search('ко'), ['Кокос', 'Коржик'])
+        self.assertEqual(self.search('о'), ['Окорок'])
@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from api.pagination import Pagination
+from recipes.models import Follow
+
+from .factories import api_client, create_recipes, create_user
+
+User = get_user_model()
+
+DEFAULT_PAGE_SIZE = 6
+CLAMPED_HEADER = Pagination.page_size_clamped_header
+
+
+class PageSizeTest(TestCase):
+    """Размер страницы по умолчанию и урезание ``limit`` до максимума."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        others = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@example.com')
+            for i in range(Pagination.max_page_size + 5)
+        )
+        create_recipes(others[0], 60)
+        Follow.objects.bulk_create(
+            Follow(user=cls.user, following=other) for other in others[:25]
+        )
+
+    def setUp(self):
+        self.client = api_client(self.user)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_page(self, response, size, clamped=False):
+        self.assertEqual(len(response.data['results']), size)
+        if clamped:
+            self.assertEqual(response[CLAMPED_HEADER], str(size))
+        else:
+            self.assertNotIn(CLAMPED_HEADER, response)
+
+    def test_limits(self):
+        cases = (
+            ('/api/recipes/', 50),
+            ('/api/users/', 20),
+            ('/api/users/subscriptions/', 20),
+        )
+        for url, max_page_size in cases:
+            with self.subTest(url=url):
+                self.assert_page(self.get(url), DEFAULT_PAGE_SIZE)
+                self.assert_page(self.get(url, limit=10), 10)
+                self.assert_page(
+                    self.get(url, limit=max_page_size), max_page_size,
+                )
+                self.assert_page(
+                    self.get(url, limit=1_000_000), max_page_size,
+                    clamped=True,
+                )
+
+    def test_users_pages_are_ordered(self):
+        seen = []
+        for page in range(1, 7):
+            response = self.get('/api/users/', page=page, limit=20)
+            seen += [user['id'] for user in response.data['results']]
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), User.objects.count())
+
+    def test_invalid_limit_falls_back_to_default(self):
+        for limit in ('abc', '0', '-5', ''):
+            with self.subTest(limit=limit):
+                self.assert_page(
+                    self.get('/api/recipes/', limit=limit), DEFAULT_PAGE_SIZE,
+                )
+
+    def test_cursor_mode_is_clamped(self):
+        response = self.get('/api/recipes/', cursor='', limit=1000)
+        self.assert_page(response, 50, clamped=True)
+        self.assertIsNotNone(response.data['next'])
@@ -0,0 +1,94 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Favorite, Follow, Purchase
+
+from .factories import (api_client, create_ingredients,
+                        create_reader_and_author, create_recipe, create_tags)
+
+RECIPES = 30
+INGREDIENTS_PER_RECIPE = 5
+
+
+class RecipeQueriesTest(TestCase):
+    """Число запросов к БД в ленте и карточке рецепта.
+
+    Оно не должно зависеть от размера страницы и числа ингредиентов:
+    флаги и состав рецептов догружаются пачкой, а не по одному.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = create_reader_and_author()
+        tags = create_tags(3)
+        ingredients = create_ingredients(RECIPES + INGREDIENTS_PER_RECIPE)
+        for number in range(RECIPES):
+            recipe = create_recipe(
+                cls.author,
+                name=f'recipe{number}',
+                ingredients=ingredients[
+                    number:number + INGREDIENTS_PER_RECIPE
+                ],
+                tags=tags,
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipes=recipe)
+                Purchase.objects.create(user=cls.user, recipes=recipe)
+        Follow.objects.create(user=cls.user, following=cls.author)
+        cls.recipe = recipe
+
+    def setUp(self):
+        cache.clear()
+        self.client = api_client(self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        counts = set()
+        for limit in (1, 10, RECIPES):
+            cache.clear()
+            response, queries = self.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(len(response.data['results']), limit)
+            counts.add(queries)
+        self.assertEqual(counts, {7})
+
+    def test_list_flags_and_ingredients(self):
+        response, _ = self.get(f'/api/recipes/?limit={RECIPES}')
+        for recipe in response.data['results']:
+            self.assertEqual(
+                len(recipe['ingredients']), INGREDIENTS_PER_RECIPE,
+            )
+            self.assertIs(recipe['author']['is_subscribed'], True)
+            flagged = int(recipe['name'].removeprefix('recipe')) % 2 == 1
+            self.assertIs(recipe['is_favorited'], flagged)
+            self.assertIs(recipe['is_in_shopping_cart'], flagged)
+
+    def test_list_warm_cache(self):
+        self.get(f'/api/recipes/?limit={RECIPES}')
+        _, queries = self.get(f'/api/recipes/?limit={RECIPES}')
+        self.assertEqual(queries, 2)
+
+    def test_list_anonymous(self):
+        self.client.force_authenticate(None)
+        response, queries = self.get(f'/api/recipes/?limit={RECIPES}')
+        self.assertEqual(queries, 4)
+        self.assertIs(response.data['results'][0]['is_favorited'], False)
+
+    def test_retrieve_queries(self):
+        response, queries = self.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(queries, 6)
+        self.assertEqual(
+            len(response.data['ingredients']), INGREDIENTS_PER_RECIPE,
+        )
+        self.assertIs(response.data['is_favorited'], True)
+
+    def test_retrieve_warm_cache(self):
+        self.get(f'/api/recipes/{self.recipe.id}/')
+        _, queries = self.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(queries, 1)
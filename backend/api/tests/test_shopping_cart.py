@@ -0,0 +1,159 @@
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from recipes.models import Ingredient, Purchase, ShoppingCartItem
+
+from .factories import (api_client, create_ingredients,
+                        create_reader_and_author, create_recipe, create_tags)
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+class DownloadShoppingCartTest(TestCase):
+    """Условные запросы выгрузки списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, author = create_reader_and_author()
+        cls.ingredients = create_ingredients(3)
+        recipe = create_recipe(author, ingredients=cls.ingredients)
+        Purchase.objects.create(user=cls.user, recipes=recipe)
+
+    def setUp(self):
+        self.client = api_client(self.user)
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, 200)
+        self.etag = response['ETag']
+        self.last_modified = response['Last-Modified']
+
+    def get(self, **headers):
+        return self.client.get(URL, headers=headers)
+
+    def test_not_modified(self):
+        cases = (
+            {'If-None-Match': self.etag},
+            {'If-Modified-Since': self.last_modified},
+            {'If-None-Match': self.etag,
+             'If-Modified-Since': self.last_modified},
+        )
+        for headers in cases:
+            with self.subTest(headers=list(headers)):
+                response = self.get(**headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], self.etag)
+
+    def test_stale_validators(self):
+        earlier = http_date(timezone.now().timestamp() - 3600)
+        response = self.get(
+            **{'If-None-Match': '"stale"', 'If-Modified-Since': earlier},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(**{'If-Unmodified-Since': earlier})
+                         .status_code, 412)
+        self.assertEqual(
+            self.get(**{'If-Unmodified-Since': self.last_modified})
+            .status_code, 200,
+        )
+
+    def test_other_format_has_own_etag(self):
+        response = self.client.get(
+            URL, {'format': 'csv'}, headers={'If-None-Match': self.etag},
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_ingredient_change_invalidates_validators(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient = self.ingredients[0]
+            ingredient.name = 'renamed'
+            ingredient.save()
+        # Выгрузка в пределах той же секунды: дата в Last-Modified
+        # не меняется, ETag меняется по версии справочника.
+        response = self.get(**{'If-None-Match': self.etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'renamed', b''.join(response.streaming_content))
+        Ingredient.objects.filter(id=ingredient.id).update(
+            updated_at=timezone.now() + timedelta(minutes=1),
+        )
+        response = self.get(**{'If-Modified-Since': self.last_modified})
+        self.assertEqual(response.status_code, 200)
+
+    def test_pdf_uses_cyrillic_font(self):
+        response = self.client.get(URL, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'DejaVuSans', content)
+
+    @override_settings(SHOPPING_CART_PDF_FONT='/nonexistent/font.ttf')
+    def test_pdf_without_font_fails(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.client.get(URL, {'format': 'pdf'})
+
+
+class RecipeEditCartTest(TestCase):
+    """Правка состава рецепта меняет корзины одним пересчетом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = create_reader_and_author()
+        cls.ingredients = create_ingredients(12)
+        cls.tags = create_tags(1)
+
+    def setUp(self):
+        self.recipe = create_recipe(
+            self.author, ingredients=self.ingredients[:10], tags=self.tags,
+        )
+        Purchase.objects.create(user=self.user, recipes=self.recipe)
+        Purchase.objects.create(user=self.author, recipes=self.recipe)
+        self.client = api_client(self.author)
+
+    def cart(self, user):
+        return dict(ShoppingCartItem.objects.filter(user=user).values_list(
+            'ingredients_id', 'amount',
+        ))
+
+    def patch(self, ingredients):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/',
+                {
+                    'ingredients': [
+                        {'id': ingredient.id, 'amount': amount}
+                        for ingredient, amount in ingredients
+                    ],
+                    'tags': [tag.id for tag in self.tags],
+                },
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_carts_follow_the_edit(self):
+        self.patch([
+            (self.ingredients[0], 25),
+            (self.ingredients[1], 10),
+            (self.ingredients[11], 3),
+        ])
+        expected = {
+            self.ingredients[0].id: 25,
+            self.ingredients[1].id: 10,
+            self.ingredients[11].id: 3,
+        }
+        self.assertEqual(self.cart(self.user), expected)
+        self.assertEqual(self.cart(self.author), expected)
+
+    def test_removed_rows_do_not_add_queries(self):
+        kept = [(self.ingredients[0], 10)]
+        removing_one = self.patch(
+            kept + [(ingredient, 10) for ingredient in self.ingredients[2:10]]
+        )
+        self.assertEqual(len(self.cart(self.user)), 9)
+        removing_eight = self.patch(kept)
+        self.assertEqual(self.cart(self.user), {self.ingredients[0].id: 10})
+        self.assertEqual(removing_one, removing_eight)
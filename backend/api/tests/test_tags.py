@@ -0,0 +1,45 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from .factories import api_client, create_tags
+
+
+class TagValidatorsTest(TestCase):
+    """ETag списка тэгов общий, у карточки тэга - свой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag, cls.other = create_tags(2)
+
+    def setUp(self):
+        cache.clear()
+        self.client = api_client()
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers=headers)
+
+    def rename(self, tag, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.name = name
+            tag.save()
+
+    def test_other_tag_edit_keeps_tag_validators(self):
+        url = f'/api/tags/{self.tag.id}/'
+        etag = self.get(url)['ETag']
+        list_etag = self.get('/api/tags/')['ETag']
+        self.rename(self.other, 'renamed')
+        self.assertEqual(self.get(url, **{'If-None-Match': etag})
+                         .status_code, 304)
+        self.assertNotEqual(self.get('/api/tags/')['ETag'], list_etag)
+
+    def test_tag_edit_changes_tag_validators(self):
+        url = f'/api/tags/{self.tag.id}/'
+        etag = self.get(url)['ETag']
+        self.rename(self.tag, 'renamed')
+        response = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'renamed')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_missing_tag(self):
+        self.assertEqual(self.get('/api/tags/0/').status_code, 404)
@@ -0,0 +1,143 @@
+import threading
+from collections import Counter
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from recipes.models import AuthorCounter, Favorite, Follow, Purchase
+
+from .factories import (api_client, create_reader_and_author, create_recipe,
+                        create_user)
+
+THREADS = 8
+
+
+def run_concurrently(function):
+    """Запускает function в THREADS потоках одновременно.
+
+    Каждый поток работает через свое соединение с БД и закрывает его.
+    """
+    barrier = threading.Barrier(THREADS)
+    results = []
+    errors = []
+
+    def worker():
+        try:
+            barrier.wait()
+            results.append(function())
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class ConcurrentToggleTest(TransactionTestCase):
+    """Одновременные переключения одной и той же пары (user, recipe)."""
+
+    def setUp(self):
+        self.user, self.author = create_reader_and_author()
+        self.recipe = create_recipe(self.author)
+
+    def request(self, method, url):
+        client = api_client(self.user)
+        return getattr(client, method)(url).status_code
+
+    def assert_one_succeeds(self, method, url, success_status):
+        statuses = run_concurrently(lambda: self.request(method, url))
+        self.assertEqual(
+            Counter(statuses), {success_status: 1, 400: THREADS - 1},
+        )
+
+    def assert_recipe_counter(self, field, value):
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, field), value)
+
+    def test_link_and_unlink_managers(self):
+        for model in (Favorite, Purchase):
+            with self.subTest(model=model.__name__):
+                linked = run_concurrently(lambda: model.objects.link(
+                    user=self.user.id, recipes=self.recipe.id,
+                ))
+                self.assertEqual(linked.count(True), 1)
+                self.assertEqual(model.objects.count(), 1)
+                unlinked = run_concurrently(lambda: model.objects.unlink(
+                    user=self.user, recipes=self.recipe,
+                ))
+                self.assertEqual(unlinked.count(True), 1)
+                self.assertFalse(model.objects.exists())
+
+    def test_favorite_endpoint(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assert_one_succeeds('post', url, 201)
+        self.assertEqual(Favorite.objects.count(), 1)
+        self.assert_recipe_counter('favorites_count', 1)
+        self.assert_one_succeeds('delete', url, 204)
+        self.assertFalse(Favorite.objects.exists())
+        self.assert_recipe_counter('favorites_count', 0)
+
+    def test_shopping_cart_endpoint(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        self.assert_one_succeeds('post', url, 201)
+        self.assertEqual(Purchase.objects.count(), 1)
+        self.assert_recipe_counter('in_carts_count', 1)
+        self.assert_one_succeeds('delete', url, 204)
+        self.assertFalse(Purchase.objects.exists())
+        self.assert_recipe_counter('in_carts_count', 0)
+
+    def test_subscribe_endpoint(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assert_one_succeeds('post', url, 201)
+        self.assertEqual(Follow.objects.count(), 1)
+        counter = AuthorCounter.objects.get(user=self.author)
+        self.assertEqual(counter.followers_count, 1)
+        self.assert_one_succeeds('delete', url, 204)
+        self.assertFalse(Follow.objects.exists())
+        counter.refresh_from_db()
+        self.assertEqual(counter.followers_count, 0)
+
+
+class SubscribeAtomicityTest(TestCase):
+    """Подписка и счетчики автора пишутся в одной транзакции."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = create_reader_and_author()
+        cls.other = create_user('other')
+
+    def setUp(self):
+        self.client = api_client(self.user)
+
+    def failing_counters(self):
+        return mock.patch.object(
+            Follow, 'change_counters', side_effect=RuntimeError,
+        )
+
+    def test_subscribe_rolls_back(self):
+        with self.failing_counters(), self.assertRaises(RuntimeError):
+            self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertFalse(Follow.objects.exists())
+
+    def test_unsubscribe_rolls_back(self):
+        Follow.objects.link(user=self.user.id, following=self.author.id)
+        with self.failing_counters(), self.assertRaises(RuntimeError):
+            self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_batch_rolls_back(self):
+        with self.failing_counters(), self.assertRaises(RuntimeError):
+            self.client.post(
+                '/api/users/subscribe/batch/',
+                {'ids': [self.author.id, self.other.id]},
+                format='json',
+            )
+        self.assertFalse(Follow.objects.exists())
@@ -0,0 +1,119 @@
+"""Потоковое декодирование изображений, присланных в base64."""
+import binascii
+import hashlib
+from base64 import b64decode
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from PIL import Image
+from rest_framework import serializers
+
+from recipes.images import validate_dimensions
+from recipes.storage import short_digest
+
+# Кратно 4 символам base64, декодируется в 48 КБ.
+CHUNK_CHARS = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+INVALID_IMAGE = 'Загрузите корректное изображение.'
+UNSUPPORTED_FORMAT = 'Неподдерживаемый формат изображения.'
+SNIFF_BYTES = 12
+WHITESPACE = str.maketrans('', '', ' \t\r\n\f\v')
+BASE64_MARKER = ';base64,'
+
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+def sniff_extension(head):
+    """Расширение по сигнатуре файла, None для неизвестных форматов."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def decode_base64_image(data):
+    """Декодирует data URL кусками во временный файл.
+
+    Размер проверяется по длине строки до декодирования, формат -
+    по первым байтам, а не по типу из префикса ``data:image/...``.
+    Переносы строк и пробелы внутри base64 допускаются, как в
+    ``b64decode`` без ``validate``; прочие посторонние символы - нет.
+    Имя файла строится по хешу содержимого.
+    """
+    # Без копирования строки: куски берутся срезами из исходных данных.
+    marker = data.find(BASE64_MARKER)
+    if marker < 0:
+        raise serializers.ValidationError('Ожидается data URL в base64.')
+    start = marker + len(BASE64_MARKER)
+    max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
+    if (len(data) - start) // 4 * 3 > max_bytes + 2:
+        raise serializers.ValidationError(
+            f'Изображение больше {max_bytes // (1024 * 1024)} МБ.'
+        )
+    hasher = hashlib.sha256()
+    file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    head = b''
+
+    def write(chunk):
+        nonlocal head
+        if len(head) < SNIFF_BYTES:
+            head += chunk[:SNIFF_BYTES - len(head)]
+            if len(head) == SNIFF_BYTES and sniff_extension(head) is None:
+                raise serializers.ValidationError(UNSUPPORTED_FORMAT)
+        hasher.update(chunk)
+        file.write(chunk)
+
+    try:
+        # Символы после последней полной четверки переносятся
+        # в следующий кусок, когда пробелы сдвигают границы.
+        rest = ''
+        for position in range(start, len(data), CHUNK_CHARS):
+            chunk = rest + data[position:position + CHUNK_CHARS].translate(
+                WHITESPACE,
+            )
+            size = len(chunk) - len(chunk) % 4
+            rest = chunk[size:]
+            write(b64decode(chunk[:size], validate=True))
+        if rest:
+            write(b64decode(rest, validate=True))
+        if not head:
+            raise serializers.ValidationError('Пустое изображение.')
+        extension = sniff_extension(head)
+        if extension is None:
+            raise serializers.ValidationError(UNSUPPORTED_FORMAT)
+        file.seek(0)
+        verify_image(file)
+        file.seek(0)
+    except binascii.Error:
+        file.close()
+        raise serializers.ValidationError('Некорректные данные base64.')
+    except serializers.ValidationError:
+        file.close()
+        raise
+    return File(file, name=f'{short_digest(hasher)}.{extension}')
+
+
+def verify_image(file):
+    """Проверка размеров и целостности без декодирования пикселей."""
+    try:
+        image = Image.open(file)
+    except Exception:
+        raise serializers.ValidationError(INVALID_IMAGE)
+    with image:
+        try:
+            validate_dimensions(*image.size)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        try:
+            image.verify()
+        except Exception:
+            raise serializers.ValidationError(INVALID_IMAGE)
@@ -6,11 +6,6 @@ from . import views
 router = DefaultRouter()
 
 router.register(r'users', views.UserModelViewSet, basename='users')
-router.register(
-    r'users/(?P<user_pk>\d+)/subscribe',
-    views.UserModelViewSet,
-    basename='subscribe',
-)
 router.register(r'recipes', views.RecipeModelViewSet)
 router.register(
     r'recipes/(?P<recipe_pk>\d+)/shopping_cart',
@@ -38,7 +33,6 @@ urlpatterns = [
         views.RecipeModelViewSet.as_view({'get': 'download_shopping_cart'}),
         name='download_shopping_cart',
     ),
-    path('', include('djoser.urls')),
     re_path(r'^auth/', include('djoser.urls.authtoken')),
     path('', include(router.urls)),
 ]
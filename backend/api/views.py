@@ -1,8 +1,14 @@
+import hashlib
 from typing import Self
 
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
@@ -10,26 +16,54 @@ from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, Prefetch
+from django.db.models.functions import Coalesce
 
+from .caching import (get_tags_data, interactions_changed, tag_etag,
+                      tag_last_modified, tags_etag, tags_last_modified)
+from .exporters import CART_FILENAME, EXPORTERS
 from .filters import IngredientFilter, TagFilter
 from .pagination import Pagination
 from .permissions import IsAuthorPermission, ReadOnlyPermission
-from .serializers import (CreateRecipeSerializer, FollowSerializer,
-                          GetUserSerializer, IngredientSerializer,
+from .serializers import (BatchIdsSerializer, CreateRecipeSerializer,
+                          FollowSerializer, IngredientSerializer,
                           NotDetailRecipeSerializer, RecipeSerializer,
-                          TagSerializer)
+                          RecipesLimitSerializer, TagSerializer)
+from recipes import ingredient_index
 from recipes.models import (Favorite, Follow, Ingredient, Purchase, Recipe,
-                            RecipeIngredient, Tag)
+                            ShoppingCartItem, Tag)
 
 User = get_user_model()
 
 
-class UserModelViewSet(GenericViewSet, ListModelMixin, RetrieveModelMixin):
-    """Представление базовой модели User."""
-    queryset = User.objects.all()
-    serializer_class = GetUserSerializer
+def batch_results(ids, found, changed, statuses):
+    """Статус пакетной операции для каждого запрошенного id."""
+    results = []
+    for id in ids:
+        if id not in found:
+            status_name = 'not_found'
+        elif id in changed:
+            status_name = statuses[0]
+        else:
+            status_name = statuses[1]
+        results.append({'id': id, 'status': status_name})
+    return {'results': results}
+
+
+class UserModelViewSet(UserViewSet):
+    """Пользователи: эндпоинты djoser и подписки.
+
+    Список сортируется по id, иначе страницы могут терять
+    и повторять пользователей.
+    """
     pagination_class = Pagination
+    lookup_field = 'pk'
+    cursor_ordering = ('id',)
+    max_page_size = 20
+
+    def get_queryset(self):
+        return super().get_queryset().order_by('id')
 
     @action(detail=False,
             methods=['get'],
@@ -37,7 +71,22 @@ class UserModelViewSet(GenericViewSet, ListModelMixin, RetrieveModelMixin):
             permission_classes=[IsAuthenticated])
     def subscriptions(self: Self, request: Request):
         user = request.user
-        subscriptions = User.objects.filter(following__user=user)
+        limit_serializer = RecipesLimitSerializer(data=request.query_params)
+        limit_serializer.is_valid(raise_exception=True)
+        recipes_limit = limit_serializer.validated_data['recipes_limit']
+        subscriptions = User.objects.filter(
+            following__user=user,
+        ).annotate(
+            recipes_count=Coalesce('counters__recipes_count', 0),
+        ).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.order_by('-created_at', '-id')[
+                    :recipes_limit
+                ],
+                to_attr='latest_recipes',
+            ),
+        ).order_by('id')
         page = self.paginate_queryset(subscriptions)
         serializer = FollowSerializer(
             page,
@@ -58,31 +107,79 @@ class UserModelViewSet(GenericViewSet, ListModelMixin, RetrieveModelMixin):
                 {'detail': 'Нельзя подписываться на самого себя.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        follow = following.following.filter(user=user)
-        serializer = FollowSerializer(
-            following,
-            context={'request': request}
-        )
-        if follow and request.method == 'DELETE':
-            follow.delete()
+        if request.method == 'DELETE':
+            with transaction.atomic():
+                changed = Follow.objects.unlink(user=user, following=following)
+                if changed:
+                    interactions_changed(request)
+            if changed:
+                return Response(
+                    {'detail': 'Подписка успешно удалена.'},
+                    status=status.HTTP_204_NO_CONTENT
+                )
             return Response(
-                {'detail': 'Подписка успешно удалена.'},
-                status=status.HTTP_204_NO_CONTENT
+                {'error': 'Ошибка подписки'},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        elif not follow and request.method == 'POST':
-            Follow.objects.create(
-                user=user,
-                following=following,
+        # Параметры ответа проверяются до записи подписки.
+        limit_serializer = RecipesLimitSerializer(data=request.query_params)
+        limit_serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            changed = Follow.objects.link(
+                user=user.id, following=following.id,
+            )
+            if changed:
+                interactions_changed(request)
+        if changed:
+            serializer = FollowSerializer(
+                following,
+                context={
+                    'request': request,
+                    'recipes_limit': (
+                        limit_serializer.validated_data['recipes_limit']
+                    ),
+                },
             )
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED,
             )
-        else:
-            return Response(
-                {'error': 'Ошибка подписки'},
-                status=status.HTTP_400_BAD_REQUEST,
+        return Response(
+            {'error': 'Ошибка подписки'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='subscribe/batch',
+            permission_classes=[IsAuthenticated])
+    def subscribe_batch(self: Self, request: Request):
+        serializer = BatchIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        found = set(
+            User.objects.filter(id__in=ids).exclude(id=user.id).values_list(
+                'id', flat=True,
             )
+        )
+        with transaction.atomic():
+            if request.method == 'DELETE':
+                changed = Follow.objects.unlink_many(
+                    user=user, following__in=found,
+                )
+                statuses = ('removed', 'missing')
+            else:
+                changed = Follow.objects.link_many(
+                    [
+                        {'user': user.id, 'following': following_id}
+                        for following_id in found
+                    ]
+                )
+                statuses = ('added', 'exists')
+            if changed:
+                interactions_changed(request)
+        return Response(batch_results(ids, found, set(changed), statuses))
 
 
 class TagModelViewSet(GenericViewSet, ListModelMixin, RetrieveModelMixin):
@@ -92,6 +189,24 @@ class TagModelViewSet(GenericViewSet, ListModelMixin, RetrieveModelMixin):
     pagination_class = None
     permission_classes = (ReadOnlyPermission | IsAdminUser,)
 
+    @method_decorator(condition(tags_etag, tags_last_modified))
+    def list(self, request, *args, **kwargs):
+        return Response(get_tags_data(
+            'list',
+            lambda: list(
+                self.get_serializer(self.get_queryset(), many=True).data
+            ),
+        ))
+
+    @method_decorator(condition(tag_etag, tag_last_modified))
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_field]
+        return Response(get_tags_data(
+            pk,
+            lambda: dict(self.get_serializer(self.get_object()).data),
+            etag=tag_etag(request, pk),
+        ))
+
 
 class IngredientModelViewSet(
     GenericViewSet,
@@ -100,33 +215,48 @@ class IngredientModelViewSet(
 ):
     """Представление CRUD для модели Ингредиентов."""
 
-    queryset = Ingredient.objects.all().distinct()
+    queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
 
 
 class RecipeModelViewSet(ModelViewSet):
     """Представление CRUD для модели Рецепта."""
-    queryset = Recipe.objects.all().prefetch_related(
-        'tags', 'ingredients').select_related('author')
+    # Теги и ингредиенты догружаются сериализатором только для рецептов,
+    # которых нет в кэше.
+    queryset = Recipe.objects.all().select_related('author')
     serializer_class = RecipeSerializer
     pagination_class = Pagination
+    max_page_size = 50
     permission_classes = (
         ReadOnlyPermission | IsAuthorPermission | IsAdminUser,
     )
     filter_backends = [DjangoFilterBackend]
     filterset_class = TagFilter
 
+    @property
+    def cursor_ordering(self):
+        """Ключ сортировки ленты, в том числе для режима курсора."""
+        if self.request.query_params.get('ordering') == 'popular':
+            return ('-favorites_count', '-created_at', '-id')
+        return ('-created_at', '-id')
+
     def get_queryset(self):
-        queryset = super().get_queryset()
+        if self.action in ('favorite', 'shopping_cart'):
+            return Recipe.objects.all()
+        queryset = super().get_queryset().order_by(*self.cursor_ordering)
         user = self.request.user
         if user.is_authenticated:
+            # Флаги в ответе берутся из кэша связей, здесь только фильтры.
             if self.request.query_params.get('is_favorited') == '1':
-                queryset = queryset.filter(favorites__user=user)
+                queryset = queryset.filter(Exists(Favorite.objects.filter(
+                    user=user, recipes=OuterRef('pk'),
+                )))
             if self.request.query_params.get('is_in_shopping_cart') == '1':
-                queryset = queryset.filter(purchases__user=user)
+                queryset = queryset.filter(Exists(Purchase.objects.filter(
+                    user=user, recipes=OuterRef('pk'),
+                )))
         return queryset
 
     def get_serializer_class(self):
@@ -140,6 +270,12 @@ class RecipeModelViewSet(ModelViewSet):
         context.update({'request': self.request})
         return context
 
+    def perform_content_negotiation(self, request, force=False):
+        """Параметр format выгрузки корзины не выбирает рендерер."""
+        if self.action == 'download_shopping_cart':
+            force = True
+        return super().perform_content_negotiation(request, force)
+
     def favorite_and_shopping_cart_logic(
             self,
             request,
@@ -149,25 +285,31 @@ class RecipeModelViewSet(ModelViewSet):
     ):
         obj = self.get_object()
         user = request.user
-        query = model.objects.filter(recipes=obj, user=user)
-        serializer = NotDetailRecipeSerializer(obj)
-        if query and request.method == 'DELETE':
-            query.delete()
-            return Response(message, status=status.HTTP_204_NO_CONTENT)
-        elif not query and request.method == 'POST':
-            model.objects.create(
-                user=user,
-                recipes=obj,
-            )
-            return Response(
-                serializer.data,
-                status=status.HTTP_201_CREATED,
-            )
+        if request.method == 'DELETE':
+            with transaction.atomic():
+                changed = model.objects.unlink(user=user, recipes=obj)
+                if changed:
+                    interactions_changed(request)
+                if changed and model is Purchase:
+                    ShoppingCartItem.objects.remove_recipe(obj, [user.id])
+            if changed:
+                return Response(message, status=status.HTTP_204_NO_CONTENT)
         else:
-            return Response(
-                {'error': 'Такого рецепта не существует'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            with transaction.atomic():
+                changed = model.objects.link(user=user.id, recipes=obj.id)
+                if changed:
+                    interactions_changed(request)
+                if changed and model is Purchase:
+                    ShoppingCartItem.objects.add_recipe(obj, [user.id])
+            if changed:
+                return Response(
+                    NotDetailRecipeSerializer(obj).data,
+                    status=status.HTTP_201_CREATED,
+                )
+        return Response(
+            {'error': 'Такого рецепта не существует'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     @action(detail=True,
             methods=['post', 'delete'],
@@ -193,39 +335,111 @@ class RecipeModelViewSet(ModelViewSet):
             model=Purchase,
         )
 
+    def batch_logic(self, request, model):
+        serializer = BatchIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        found = set(
+            Recipe.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        with transaction.atomic():
+            if request.method == 'DELETE':
+                changed = model.objects.unlink_many(
+                    user=user, recipes__in=found,
+                )
+                statuses = ('removed', 'missing')
+                sign = -1
+            else:
+                changed = model.objects.link_many(
+                    [
+                        {'user': user.id, 'recipes': recipe_id}
+                        for recipe_id in found
+                    ]
+                )
+                statuses = ('added', 'exists')
+                sign = 1
+            if changed:
+                interactions_changed(request)
+            if changed and model is Purchase:
+                ShoppingCartItem.objects.add_recipes(changed, user.id, sign)
+        return Response(batch_results(ids, found, set(changed), statuses))
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='favorite/batch',
+            permission_classes=(IsAuthenticated,))
+    def favorite_batch(self: Self, request: Request):
+        return self.batch_logic(request, Favorite)
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='shopping_cart/batch',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self: Self, request: Request):
+        return self.batch_logic(request, Purchase)
+
     @action(detail=False,
             methods=['get'],
             url_path='download_shopping_cart',
             permission_classes=(IsAuthenticated, IsAuthorPermission,))
     def download_shopping_cart(self: Self, request: Request):
         user = request.user
-        cart_data = RecipeIngredient.objects.filter(
-            recipes__purchases__user=user
-        ).select_related('ingredients').values(
-            'ingredients__name',
-            'ingredients__measurement_unit').annotate(
-                amount=Sum('amount')
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in EXPORTERS:
+            return Response(
+                {'error': 'Неподдерживаемый формат: {}.'.format(
+                    export_format
+                )},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        cart_state = Purchase.objects.filter(user=user).aggregate(
+            recipes_count=Count('id'),
+            purchases_modified=Max('updated_at'),
+            recipes_modified=Max('recipes__updated_at'),
         )
-        if not cart_data:
+        if not cart_state['recipes_count']:
             return Response(
                 {'error': 'Корзина пуста.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        lines = [
-            [
-                item['ingredients__name'],
-                item['ingredients__measurement_unit'],
-                str(item['amount'])
-            ]
-            for item in cart_data
-        ]
-        formated_response = []
-        promo = 'Список покупок\n'
-        formated_response.append(promo)
-        for line in lines:
-            formated_line = f'{line[0]} ({line[1]}) - {line[2]}\n'
-            formated_response.append(formated_line)
-        filename = 'список_покупок.txt'
-        response = HttpResponse(formated_response, content_type='text/plain')
+        ingredients_modified = ShoppingCartItem.objects.filter(
+            user=user,
+        ).aggregate(modified=Max('ingredients__updated_at'))['modified']
+        last_modified = max(filter(None, (
+            cart_state['purchases_modified'],
+            cart_state['recipes_modified'],
+            ingredients_modified,
+        )))
+        # Удаление ингредиента не меняет ничьих дат, его учитывает
+        # версия справочника.
+        etag = '"{}"'.format(hashlib.md5(
+            '{}:{}:{}:{}'.format(
+                export_format,
+                cart_state['recipes_count'],
+                last_modified.isoformat(),
+                ingredient_index.get_version(),
+            ).encode()
+        ).hexdigest())
+        last_modified = int(last_modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+        )
+        if response is not None:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            return response
+        cart_data = ShoppingCartItem.objects.filter(user=user).values(
+            'ingredients__name',
+            'ingredients__measurement_unit',
+            'amount',
+        ).order_by('ingredients__name')
+        exporter, content_type = EXPORTERS[export_format]
+        filename = f'{CART_FILENAME}.{export_format}'
+        response = StreamingHttpResponse(
+            exporter(cart_data), content_type=content_type,
+        )
         response['Content-Disposition'] = f'attachment; filename={filename}'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
         return response
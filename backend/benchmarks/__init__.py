@@ -0,0 +1,8 @@
+"""Замеры производительности.
+
+Обычный ``manage.py test`` их не находит, запуск отдельно::
+
+    python manage.py test benchmarks --pattern 'bench_*.py'
+
+Результаты печатаются в stdout, проверки в них нарочно грубые.
+"""
@@ -0,0 +1,77 @@
+import os
+import time
+import tracemalloc
+from base64 import b64decode, b64encode
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+from PIL import Image
+
+from api.uploads import decode_base64_image
+
+SIDE = 1600
+LINE_LENGTH = 76
+
+
+def make_payload():
+    """PNG из шума около 7 МБ: он почти не сжимается."""
+    image = Image.frombytes('RGB', (SIDE, SIDE), os.urandom(SIDE * SIDE * 3))
+    buffer = BytesIO()
+    image.save(buffer, 'PNG', compress_level=0)
+    return buffer.getvalue()
+
+
+def legacy_decode(data):
+    """Прежний Base64ImageFieldSerializer: строка и байты целиком."""
+    header, encoded = data.split(';base64,')
+    extension = header.split('/')[-1]
+    return ContentFile(b64decode(encoded), name=f'image.{extension}')
+
+
+def measure(decode, data):
+    tracemalloc.start()
+    started = time.perf_counter()
+    file = decode(data)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    file.close()
+    return peak, elapsed
+
+
+class ImageUploadMemoryBenchmark(SimpleTestCase):
+    """Пиковая память декодирования base64 по tracemalloc."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.image = make_payload()
+        encoded = b64encode(cls.image).decode()
+        cls.payloads = {
+            'single line': f'data:image/png;base64,{encoded}',
+            'wrapped': 'data:image/png;base64,' + '\n'.join(
+                encoded[position:position + LINE_LENGTH]
+                for position in range(0, len(encoded), LINE_LENGTH)
+            ),
+        }
+
+    def test_peak_memory(self):
+        megabyte = 1024 * 1024
+        print(f'\nimage {len(self.image) / megabyte:.1f} MiB')
+        for case, data in self.payloads.items():
+            streaming, streaming_time = measure(decode_base64_image, data)
+            legacy, legacy_time = measure(legacy_decode, data)
+            print(
+                f'{case}: streaming peak {streaming / megabyte:.1f} MiB '
+                f'{streaming_time * 1000:.0f} ms, legacy peak '
+                f'{legacy / megabyte:.1f} MiB {legacy_time * 1000:.0f} ms'
+            )
+            self.assertLess(streaming, len(self.image) / 4)
+            self.assertLess(streaming, legacy)
+
+    def test_decoded_file_matches(self):
+        for data in self.payloads.values():
+            file = decode_base64_image(data)
+            with file:
+                self.assertEqual(file.read(), self.image)
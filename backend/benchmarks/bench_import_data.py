@@ -0,0 +1,80 @@
+import csv
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+
+from recipes.models import Ingredient, Tag
+
+INGREDIENTS = 100_000
+TAGS = 20_000
+
+
+class ImportDataBenchmark(TestCase):
+    """import_data: пачки INSERT ... ON CONFLICT против --copy.
+
+    Каждый режим грузит файлы в пустые таблицы и затем повторно,
+    когда все строки уже есть.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.paths = {
+            'ingredients': os.path.join(cls.directory.name, 'ingredients.csv'),
+            'tags': os.path.join(cls.directory.name, 'tags.csv'),
+        }
+        with open(cls.paths['ingredients'], 'w', newline='') as file:
+            csv.writer(file).writerows(
+                (f'ingredient {number}', 'г') for number in range(INGREDIENTS)
+            )
+        with open(cls.paths['tags'], 'w', newline='') as file:
+            csv.writer(file).writerows(
+                (f'tag {number}', f'#{number:06X}', f'tag-{number}')
+                for number in range(TAGS)
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def run_import(self, copy):
+        started = time.perf_counter()
+        call_command(
+            'import_data', 'ingredients', 'tags',
+            ingredients=[self.paths['ingredients']],
+            tags=[self.paths['tags']],
+            copy=copy,
+            stdout=StringIO(),
+        )
+        return time.perf_counter() - started
+
+    def measure(self, copy):
+        with transaction.atomic():
+            first = self.run_import(copy)
+            self.assertEqual(Ingredient.objects.count(), INGREDIENTS)
+            self.assertEqual(Tag.objects.count(), TAGS)
+            again = self.run_import(copy)
+            self.assertEqual(Ingredient.objects.count(), INGREDIENTS)
+            transaction.set_rollback(True)
+        return first, again
+
+    def test_copy_vs_orm(self):
+        results = {
+            'orm': self.measure(copy=False),
+            'copy': self.measure(copy=True),
+        }
+        rows = INGREDIENTS + TAGS
+        print()
+        for mode, (first, again) in results.items():
+            print(
+                f'{mode}: {rows} rows, load {first:.2f} s '
+                f'({rows / first:.0f} rows/s), reload {again:.2f} s'
+            )
+        self.assertLess(results['copy'][0], results['orm'][0])
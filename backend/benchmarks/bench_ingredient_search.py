@@ -0,0 +1,119 @@
+import random
+import statistics
+import time
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from api.tests.factories import api_client
+from recipes.models import Ingredient
+
+CATALOGUE_SIZE = 100_000
+ROUNDS = 20
+SYLLABLES = (
+    'ба', 'ва', 'го', 'да', 'ке', 'ли', 'мо', 'ло', 'ко', 'ра', 'са', 'ты',
+    'фу', 'хе', 'ча', 'шо', 'ем', 'ан', 'ок', 'ус',
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.')
+PREFIX_QUERIES = {
+    'prefix': 'моло',
+    'short prefix': 'м',
+    'many prefix matches': 'кора',
+}
+# Совпадений по началу нет, результат целиком дает поиск по вхождению.
+SUBSTRING_QUERIES = {
+    'substring': 'оло',
+    'no match': 'щщщ',
+    'short, substring skipped': 'щ',
+}
+
+
+def synthetic_names(count):
+    """Детерминированный набор названий из 2-4 «слогов» и номера."""
+    generator = random.Random(0)
+    for number in range(count):
+        word = ''.join(
+            generator.choice(SYLLABLES)
+            for _ in range(generator.randint(2, 4))
+        )
+        yield f'{word} {number}', generator.choice(UNITS)
+
+
+def median_ms(function):
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+@override_settings(INGREDIENT_INDEX_ENABLED=False)
+class IngredientSearchBenchmark(TestCase):
+    """Автодополнение ингредиентов на синтетическом справочнике."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in synthetic_names(CATALOGUE_SIZE)
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE recipes_ingredient')
+
+    def setUp(self):
+        self.client = api_client()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_prefix_latency(self):
+        for case, name in PREFIX_QUERIES.items():
+            endpoint = median_ms(lambda: self.search(name))
+            # Прежний SearchFilter('^name'): ILIKE без индекса и DISTINCT.
+            legacy = median_ms(lambda: list(
+                Ingredient.objects.filter(name__istartswith=name).distinct()
+            ))
+            print(
+                f'\n{case} {name!r}: endpoint {endpoint:.1f} ms, '
+                f'legacy prefix filter {legacy:.1f} ms'
+            )
+        prefix = median_ms(lambda: self.search(PREFIX_QUERIES['prefix']))
+        self.assertLess(prefix, 100)
+
+    def test_substring_latency(self):
+        timings = {}
+        for case, name in SUBSTRING_QUERIES.items():
+            timings[case] = median_ms(lambda: self.search(name))
+            with self.settings(INGREDIENT_INDEX_ENABLED=True):
+                in_memory = median_ms(lambda: self.search(name))
+            print(
+                f'\n{case} {name!r}: database {timings[case]:.1f} ms, '
+                f'in-memory index {in_memory:.1f} ms'
+            )
+        results = self.search(SUBSTRING_QUERIES['substring'])
+        self.assertEqual(len(results), 50)
+        self.assertTrue(all('оло' in item['name'] for item in results))
+        self.assertLess(timings['substring'], 500)
+        self.assertLess(timings['short, substring skipped'], 50)
+
+    def test_prefix_matches_come_first(self):
+        names = [item['name'] for item in self.search('ралоко')]
+        prefixed = [name.startswith('ралоко') for name in names]
+        self.assertEqual(prefixed, [True] * 3 + [False] * 3)
+        self.assertTrue(all('ралоко' in name for name in names))
+
+    def test_prefix_search_uses_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'EXPLAIN SELECT id FROM recipes_ingredient '
+                "WHERE LOWER(name) LIKE 'моло%%' ORDER BY LOWER(name) "
+                'LIMIT 50'
+            )
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('ingredient_name_lower_like', plan)
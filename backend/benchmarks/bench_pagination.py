@@ -0,0 +1,85 @@
+import statistics
+import time
+
+from django.db import connection
+from django.test import TestCase
+
+from api.pagination import Pagination
+from api.tests.factories import api_client, create_recipes, create_user
+from recipes.models import Recipe
+
+PAGE_SIZE = 10
+DEEP_PAGE = 1000
+RECIPES = PAGE_SIZE * DEEP_PAGE + PAGE_SIZE
+ROUNDS = 20
+
+
+class PaginationBenchmark(TestCase):
+    """Первая и тысячная страница ленты: LIMIT/OFFSET против курсора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipes(create_user('author'), RECIPES, batch_size=5000)
+        with connection.cursor() as cursor:
+            # created_at проставляется при вставке, разносим его по времени.
+            cursor.execute(
+                'UPDATE recipes_recipe '
+                "SET created_at = created_at - id * INTERVAL '1 minute'"
+            )
+            cursor.execute('ANALYZE recipes_recipe')
+
+    def setUp(self):
+        self.client = api_client()
+
+    def cursor_for_page(self, page):
+        """Курсор, указывающий на последний рецепт предыдущей страницы."""
+        if page == 1:
+            return ''
+        last = Recipe.objects.order_by('-created_at', '-id').values_list(
+            'created_at', 'id',
+        )[(page - 1) * PAGE_SIZE - 1]
+        return Pagination().encode_cursor(list(last))
+
+    def median_ms(self, params):
+        self.client.get('/api/recipes/', params)
+        timings = []
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            response = self.client.get('/api/recipes/', params)
+            timings.append(time.perf_counter() - started)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), PAGE_SIZE)
+        return statistics.median(timings) * 1000
+
+    def test_deep_page_latency(self):
+        results = {}
+        for page in (1, DEEP_PAGE):
+            results['offset', page] = self.median_ms(
+                {'page': page, 'limit': PAGE_SIZE},
+            )
+            results['cursor', page] = self.median_ms(
+                {'cursor': self.cursor_for_page(page), 'limit': PAGE_SIZE},
+            )
+        print()
+        for (mode, page), elapsed in results.items():
+            print(f'{mode} page {page}: {elapsed:.1f} ms')
+        self.assertLess(
+            results['cursor', DEEP_PAGE], results['offset', DEEP_PAGE],
+        )
+        self.assertLess(
+            results['cursor', DEEP_PAGE], results['cursor', 1] * 3,
+        )
+
+    def test_pages_match(self):
+        """Тысячная страница в обоих режимах одна и та же."""
+        offset = self.client.get(
+            '/api/recipes/', {'page': DEEP_PAGE, 'limit': PAGE_SIZE},
+        ).data['results']
+        cursor = self.client.get(
+            '/api/recipes/',
+            {'cursor': self.cursor_for_page(DEEP_PAGE), 'limit': PAGE_SIZE},
+        ).data['results']
+        self.assertEqual(
+            [recipe['id'] for recipe in offset],
+            [recipe['id'] for recipe in cursor],
+        )
@@ -0,0 +1,114 @@
+import time
+
+from django.db import connection, transaction
+from django.test import TestCase
+
+from api.serializers import CreateRecipeSerializer
+from api.tests.factories import (create_ingredients, create_recipe,
+                                 create_tags, create_user)
+from recipes.models import RecipeIngredient
+
+INGREDIENTS_PER_RECIPE = 15
+ROUNDS = 20
+LINK_TABLES = ('recipes_recipeingredient', 'recipes_recipetag')
+
+
+def written_rows():
+    """Строки, вставленные, обновленные и удаленные в текущей транзакции."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0) '
+            'FROM pg_stat_xact_user_tables WHERE relname = ANY(%s)',
+            [list(LINK_TABLES)],
+        )
+        return cursor.fetchone()[0]
+
+
+@transaction.atomic
+def clear_and_recreate(recipe, ingredients_data, tags_data):
+    """Прежний способ обновления: удалить все связи и создать заново."""
+    recipe.tags.clear()
+    recipe.tags.set(tags_data)
+    recipe.ingredients.clear()
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            ingredients_id=ingredient_data['id'],
+            recipes=recipe,
+            amount=ingredient_data['amount'],
+        )
+        for ingredient_data in ingredients_data
+    )
+
+
+def diff_update(recipe, payload):
+    serializer = CreateRecipeSerializer(
+        recipe, data=payload, partial=True, context={'request': None},
+    )
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+
+
+class RecipeUpdateBenchmark(TestCase):
+    """Объем записи в таблицы связей при типичных правках рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.tags = create_tags(3)
+        cls.ingredients = create_ingredients(INGREDIENTS_PER_RECIPE + 1)
+        cls.recipes = {
+            way: create_recipe(
+                author,
+                name=way,
+                ingredients=cls.ingredients[:INGREDIENTS_PER_RECIPE],
+                tags=cls.tags,
+            )
+            for way in ('diff', 'recreate')
+        }
+
+    def payloads(self):
+        """Правки: опечатка в тексте, одно количество, замена ингредиента."""
+        ingredients = [
+            {'id': ingredient.id, 'amount': 10}
+            for ingredient in self.ingredients[:INGREDIENTS_PER_RECIPE]
+        ]
+        tags = [tag.id for tag in self.tags]
+        changed_amount = [dict(item) for item in ingredients]
+        changed_amount[0]['amount'] = 20
+        replaced = ingredients[1:] + [
+            {'id': self.ingredients[-1].id, 'amount': 10},
+        ]
+        return {
+            'text': {'ingredients': ingredients, 'tags': tags,
+                     'text': 'fixed text'},
+            'amount': {'ingredients': changed_amount, 'tags': tags},
+            'replace': {'ingredients': replaced, 'tags': tags},
+        }
+
+    def measure(self, update):
+        rows = written_rows()
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            with transaction.atomic():
+                update()
+                transaction.set_rollback(True)
+        elapsed = (time.perf_counter() - started) / ROUNDS
+        return (written_rows() - rows) / ROUNDS, elapsed
+
+    def test_diff_update_writes_less(self):
+        diff, recreate = self.recipes['diff'], self.recipes['recreate']
+        for edit, payload in self.payloads().items():
+            diff_rows, diff_time = self.measure(
+                lambda: diff_update(diff, payload),
+            )
+            recreate_rows, recreate_time = self.measure(
+                lambda: clear_and_recreate(
+                    recreate, payload['ingredients'], payload['tags'],
+                ),
+            )
+            print(
+                f'\n{edit}: diff {diff_rows:.0f} rows '
+                f'{diff_time * 1000:.1f} ms, clear-and-recreate '
+                f'{recreate_rows:.0f} rows {recreate_time * 1000:.1f} ms'
+            )
+            self.assertLess(diff_rows, recreate_rows)
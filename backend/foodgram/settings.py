@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -107,6 +108,25 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# LocMemCache подходит только для одного процесса: версии кэша
+# рецептов и связей пользователей и состояние тэгов должны быть общими
+# для всех воркеров, в docker-compose для этого поднимается Redis.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+# Индекс ингредиентов в памяти воркера. Для нескольких воркеров нужен
+# общий CACHE_BACKEND, через который они узнают об изменениях справочника.
+INGREDIENT_INDEX_ENABLED = os.getenv(
+    'INGREDIENT_INDEX_ENABLED', default='False'
+) == 'True'
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SERIALIZERS': {
@@ -129,6 +149,8 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.Pagination',
+    'PAGE_SIZE': 6,
 }
 
 INTERNAL_IPS = [
@@ -140,3 +162,23 @@ CSRF_TRUSTED_ORIGINS = ['https://foodgramdjan.ddns.net']
 
 
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 5000
+
+# TTF с кириллицей для PDF, в образе backend ставится fonts-dejavu-core.
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+# Размеры фото рецептов: имя -> (ширина, высота) в пикселях.
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': (160, 160),
+    'medium': (480, 480),
+    'full': (1280, 1280),
+}
+RECIPE_IMAGE_MAX_SIDE = int(os.getenv('RECIPE_IMAGE_MAX_SIDE', default=8000))
+# Потоков для нарезки размеров, 0 - нарезать сразу в потоке запроса.
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+# Предел размера загружаемой фотографии после декодирования base64.
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.getenv('RECIPE_IMAGE_MAX_BYTES', default=10 * 1024 * 1024)
+)
@@ -1,20 +1,130 @@
-from django.contrib import admin
+import io
+from functools import partial
 
-from .models import (Favorite, Follow, Ingredient, Purchase, Recipe,
-                     RecipeIngredient, RecipeTag, Tag, User)
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import path
+
+from api.caching import invalidate_interactions
+
+from .models import (AuthorCounter, Favorite, Follow, Ingredient, Purchase,
+                     Recipe, RecipeIngredient, RecipeTag, ShoppingCartItem,
+                     Tag, User)
+from .loaders import read_lines
+from .transfer import RecipeImporter, export_recipes
+
+# Сколько ошибок загрузки показать, остальные только считаются.
+IMPORT_ERRORS_SHOWN = 20
 
 admin.site.unregister(User)
 
 
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода вместо списка значений из таблицы.
+
+    Список значений строится запросом по всей таблице при каждом
+    открытии страницы, поле ввода запросов не делает.
+    """
+
+    template = 'admin/input_filter.html'
+    input_type = 'text'
+    placeholder = ''
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(
+                remove=[self.parameter_name],
+            ),
+            'query_parts': [
+                (name, value)
+                for name, value in changelist.params.items()
+                if name != self.parameter_name
+            ],
+            'display': 'Все',
+        }
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value:
+            return queryset.filter(**{self.parameter_name: value})
+        return queryset
+
+
+class IdFilter(InputFilter):
+    """Фильтр по id связанного объекта вместо списка всей таблицы."""
+
+    input_type = 'number'
+    placeholder = 'id'
+
+    def queryset(self, request, queryset):
+        if (self.value() or '').isdigit():
+            return super().queryset(request, queryset)
+        return queryset
+
+
+class MeasurementUnitFilter(InputFilter):
+    title = 'единице измерения'
+    parameter_name = 'measurement_unit'
+    placeholder = 'г'
+
+
+def id_filter(field, title):
+    """Фильтр по ``<field>_id`` для внешнего ключа ``field``."""
+    return type(
+        f'{field.capitalize()}IdFilter',
+        (IdFilter,),
+        {'title': title, 'parameter_name': f'{field}_id'},
+    )
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Без COUNT(*) по всей таблице на каждой странице списка."""
+
+    show_full_result_count = False
+
+
+class LinkAdmin(LargeTableAdmin):
+    """Связи пользователя: удаление сбрасывает кэш его связей."""
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        transaction.on_commit(partial(invalidate_interactions, obj.user_id))
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            transaction.on_commit(partial(invalidate_interactions, user_id))
+
+
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(LargeTableAdmin):
     list_display = ['pk', 'username', 'email']
+    search_fields = ['username', 'email']
+    ordering = ['pk']
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LinkAdmin):
     list_display = ['id', 'user', 'following']
-    list_filter = ['user', 'following']
+    list_filter = [
+        id_filter('user', 'подписчику'),
+        id_filter('following', 'автору'),
+    ]
+    list_select_related = ['user', 'following']
+    autocomplete_fields = ['user', 'following']
     search_fields = [
         'user__email',
         'user__username',
@@ -24,7 +134,7 @@ class FollowAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdmin):
     list_display = [
         'id',
         'name',
@@ -32,12 +142,16 @@ class IngredientAdmin(admin.ModelAdmin):
         'created_at',
         'updated_at',
     ]
-    list_filter = ['name', 'measurement_unit']
+    list_filter = [MeasurementUnitFilter]
     search_fields = ['name']
 
 
+class RecipeImportForm(forms.Form):
+    file = forms.FileField(label='Файл NDJSON')
+
+
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdmin):
     list_display = [
         'id',
         'name',
@@ -47,8 +161,27 @@ class RecipeAdmin(admin.ModelAdmin):
         'cooking_time',
         'favorites_count',
     ]
-    list_filter = ['author', 'name', 'tags']
+    list_filter = [id_filter('author', 'автору'), 'tags']
+    list_select_related = ['author']
+    autocomplete_fields = ['author']
     search_fields = ['name']
+    actions = ['export_ndjson']
+    change_list_template = 'admin/recipes/recipe/change_list.html'
+
+    def get_urls(self):
+        return [
+            path(
+                'import-ndjson/',
+                self.admin_site.admin_view(self.import_ndjson),
+                name='recipes_recipe_import_ndjson',
+            ),
+        ] + super().get_urls()
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('name')),
+            Prefetch('ingredients', queryset=Ingredient.objects.only('name')),
+        )
 
     def get_tags_names(self, obj):
         return ', '.join([tag.name for tag in obj.tags.all()])
@@ -62,14 +195,81 @@ class RecipeAdmin(admin.ModelAdmin):
 
     get_ingredients_names.short_description = 'Ingredients'
 
-    def favorites_count(self, obj):
-        return obj.favorites.count()
+    @admin.action(description='Выгрузить в NDJSON')
+    def export_ndjson(self, request, queryset):
+        response = StreamingHttpResponse(
+            export_recipes(queryset),
+            content_type='application/x-ndjson; charset=utf-8',
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"'
+        )
+        return response
+
+    def import_ndjson(self, request):
+        """Загрузка файла из выгрузки export_ndjson тем же загрузчиком."""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = RecipeImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            errors = []
+
+            def on_error(line, error):
+                if len(errors) < IMPORT_ERRORS_SHOWN:
+                    errors.append(f'Строка {line}: {error}')
+
+            importer = RecipeImporter(on_error=on_error)
+            try:
+                importer.run(read_lines(io.TextIOWrapper(
+                    form.cleaned_data['file'].file, encoding='utf8',
+                )))
+            except UnicodeDecodeError:
+                messages.error(request, 'Файл должен быть в UTF-8.')
+            messages.success(
+                request,
+                f'Создано рецептов: {importer.created}, '
+                f'уже были: {importer.existing}, '
+                f'с ошибками: {importer.invalid}',
+            )
+            for error in errors:
+                messages.warning(request, error)
+            return redirect('admin:recipes_recipe_changelist')
+        return render(
+            request,
+            'admin/recipes/recipe/import_ndjson.html',
+            {
+                **self.admin_site.each_context(request),
+                'opts': self.model._meta,
+                'form': form,
+                'title': 'Загрузка рецептов из NDJSON',
+            },
+        )
+
+
+class RecipePartAdmin(LargeTableAdmin):
+    """Состав рецепта: изменения сдвигают updated_at рецепта.
 
-    favorites_count.short_description = 'Favorites'
+    Сохранение обрабатывает сигнал, удаление - админка, чтобы
+    каскадное удаление рецепта не обновляло удаляемые строки.
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'recipes' in form.changed_data:
+            Recipe.objects.touch([form.initial['recipes']])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Recipe.objects.touch([obj.recipes_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipes_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Recipe.objects.touch(recipe_ids)
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(RecipePartAdmin):
     list_display = [
         'id',
         'recipes',
@@ -78,7 +278,12 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
         'created_at',
         'updated_at'
     ]
-    list_filter = ['recipes', 'ingredients', 'amount']
+    list_filter = [
+        id_filter('recipes', 'рецепту'),
+        id_filter('ingredients', 'ингредиенту'),
+    ]
+    list_select_related = ['recipes', 'ingredients']
+    autocomplete_fields = ['recipes', 'ingredients']
 
 
 @admin.register(Tag)
@@ -89,7 +294,7 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(RecipeTag)
-class RecipeTagsAdmin(admin.ModelAdmin):
+class RecipeTagsAdmin(RecipePartAdmin):
     list_display = [
         'id',
         'recipes',
@@ -97,17 +302,47 @@ class RecipeTagsAdmin(admin.ModelAdmin):
         'created_at',
         'updated_at'
     ]
-    list_filter = ['recipes', 'tags']
+    list_filter = [id_filter('recipes', 'рецепту'), 'tags']
+    list_select_related = ['recipes', 'tags']
+    autocomplete_fields = ['recipes', 'tags']
 
 
 @admin.register(Purchase)
-class PurchaseAdmin(admin.ModelAdmin):
+class PurchaseAdmin(LinkAdmin):
     list_display = ['id', 'user', 'recipes', 'created_at', 'updated_at']
-    list_filter = ['user', 'recipes']
+    list_filter = [
+        id_filter('user', 'пользователю'),
+        id_filter('recipes', 'рецепту'),
+    ]
+    list_select_related = ['user', 'recipes']
+    autocomplete_fields = ['user', 'recipes']
+    search_fields = ['user__email', 'user__username']
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LinkAdmin):
     list_display = ['id', 'user', 'recipes', 'created_at', 'updated_at']
-    list_filter = ['user', 'recipes']
+    list_filter = [
+        id_filter('user', 'пользователю'),
+        id_filter('recipes', 'рецепту'),
+    ]
+    list_select_related = ['user', 'recipes']
+    autocomplete_fields = ['user', 'recipes']
+    search_fields = ['user__email', 'user__username']
+
+
+@admin.register(ShoppingCartItem)
+class ShoppingCartItemAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'ingredients', 'amount', 'updated_at']
+    list_filter = [id_filter('user', 'пользователю')]
+    list_select_related = ['user', 'ingredients']
+    autocomplete_fields = ['user', 'ingredients']
+    search_fields = ['user__email', 'user__username']
+
+
+@admin.register(AuthorCounter)
+class AuthorCounterAdmin(LargeTableAdmin):
+    list_display = ['user', 'recipes_count', 'followers_count']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
     search_fields = ['user__email', 'user__username']
@@ -0,0 +1,94 @@
+"""Нарезка фотографий рецептов на размеры в фоновых потоках."""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .storage import content_digest
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/renditions'
+RENDITION_FORMAT = 'WEBP'
+RENDITION_QUALITY = 80
+
+# Потоки запускаются при первой задаче. Pillow отпускает GIL
+# при декодировании, масштабировании и кодировании.
+executor = ThreadPoolExecutor(
+    max_workers=max(settings.RECIPE_IMAGE_WORKERS, 1),
+    thread_name_prefix='recipe-images',
+)
+
+
+def validate_dimensions(width, height):
+    """Проверка размеров по заголовку файла, до декодирования пикселей."""
+    max_side = settings.RECIPE_IMAGE_MAX_SIDE
+    if max(width, height) > max_side:
+        raise ValidationError(
+            f'Изображение больше {max_side} пикселей по одной из сторон.'
+        )
+
+
+def render(image, size):
+    """Уменьшенная копия в WebP, пропорции сохраняются."""
+    rendition = image.copy()
+    rendition.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    rendition.save(buffer, RENDITION_FORMAT, quality=RENDITION_QUALITY)
+    return buffer.getvalue()
+
+
+def build_renditions(recipe_id):
+    """Нарезает размеры текущей фотографии рецепта и сохраняет их имена."""
+    recipe = Recipe.objects.only('image').filter(id=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    source = recipe.image.name
+    with recipe.image.open('rb') as file:
+        data = file.read()
+    with Image.open(BytesIO(data)) as image:
+        validate_dimensions(*image.size)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        digest = content_digest(data)
+        renditions = {'source': source}
+        for rendition, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+            name = f'{RENDITIONS_DIR}/{digest}-{rendition}.webp'
+            if not default_storage.exists(name):
+                saved = default_storage.save(
+                    name, ContentFile(render(image, size)),
+                )
+                if saved != name:
+                    # Тот же файл успела сохранить параллельная задача.
+                    default_storage.delete(saved)
+            renditions[rendition] = name
+    # Фото могли заменить, пока шла нарезка.
+    Recipe.objects.filter(id=recipe_id, image=source).update(
+        image_renditions=renditions, updated_at=timezone.now(),
+    )
+
+
+def run_job(recipe_id):
+    try:
+        build_renditions(recipe_id)
+    except Exception:
+        logger.exception('Не удалось нарезать фото рецепта %s', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(recipe_id):
+    """Ставит нарезку в очередь пула после коммита транзакции."""
+    if not settings.RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(lambda: build_renditions(recipe_id))
+        return
+    transaction.on_commit(lambda: executor.submit(run_job, recipe_id))
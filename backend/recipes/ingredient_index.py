@@ -0,0 +1,81 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения."""
+import threading
+from bisect import bisect_left
+
+
+from . import versions
+from .models import Ingredient
+
+VERSION_KEY = 'recipes:ingredient_index:version'
+
+
+def get_version():
+    """Текущая версия справочника ингредиентов, общая для всех воркеров."""
+    return versions.get_version(VERSION_KEY)
+
+
+def bump_version():
+    """Помечает индексы во всех воркерах как устаревшие."""
+    versions.bump_version(VERSION_KEY)
+
+
+class IngredientIndex:
+    """Отсортированный по названию массив ингредиентов.
+
+    Перестраивается лениво при первом запросе после смены версии.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._rows = []
+
+    def refresh(self):
+        version = get_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            rows = sorted(
+                Ingredient.objects.order_by().values_list(
+                    'id', 'name', 'measurement_unit',
+                ).iterator(),
+                key=lambda row: (row[1].lower(), row[0]),
+            )
+            self._keys = [row[1].lower() for row in rows]
+            self._rows = rows
+            self._version = version
+
+    def search(self, name, limit, substring=True):
+        """Сначала совпадения по началу названия, затем по вхождению."""
+        self.refresh()
+        keys, rows = self._keys, self._rows
+        name = name.lower()
+        found = []
+        position = bisect_left(keys, name)
+        while (
+            position < len(keys)
+            and len(found) < limit
+            and keys[position].startswith(name)
+        ):
+            found.append(rows[position])
+            position += 1
+        if substring and len(found) < limit:
+            for key, row in zip(keys, rows):
+                if name in key and not key.startswith(name):
+                    found.append(row)
+                    if len(found) == limit:
+                        break
+        return [
+            Ingredient(
+                id=ingredient_id,
+                name=ingredient_name,
+                measurement_unit=measurement_unit,
+            )
+            for ingredient_id, ingredient_name, measurement_unit in found
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,131 @@
+"""Потоковые чтение и запись CSV и JSON для загрузки и выгрузки."""
+import csv
+import json
+import os
+from itertools import islice
+
+CHUNK_SIZE = 64 * 1024
+# Предел одного объекта JSON-массива, чтобы битый файл не читался
+# в память целиком в поисках конца объекта.
+MAX_ITEM_CHARS = 16 * 1024 * 1024
+FORMATS = ('csv', 'json')
+
+
+def get_format(path, file_format=None):
+    """Формат файла: явно заданный или по расширению."""
+    file_format = file_format or os.path.splitext(path)[1][1:].lower()
+    if file_format in ('jsonl', 'ndjson'):
+        return 'json'
+    if file_format not in FORMATS:
+        raise ValueError(f'Неизвестный формат файла: {path}')
+    return file_format
+
+
+def read_csv(file, fields):
+    """Строки CSV как словари, пустые строки и заголовок пропускаются."""
+    for row in csv.reader(file):
+        if not any(row):
+            continue
+        if tuple(row) == fields:
+            continue
+        yield dict(zip(fields, row))
+
+
+def read_lines(file):
+    """Непустые строки файла с номерами, в памяти одна строка."""
+    for number, line in enumerate(file, 1):
+        if line.strip():
+            yield number, line
+
+
+def read_json_lines(file):
+    """Объекты JSON Lines, ошибка разбора сообщает номер строки."""
+    for number, line in read_lines(file):
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            raise ValueError(f'Строка {number}: {error}') from None
+
+
+def read_json(file):
+    """Объекты из JSON-массива или из JSON Lines без загрузки всего файла."""
+    decoder = json.JSONDecoder()
+    buffer, position = file.read(CHUNK_SIZE).lstrip(), 0
+    is_array = buffer.startswith('[')
+    if not is_array:
+        file.seek(0)
+        yield from read_json_lines(file)
+        return
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if buffer[position:position + 1] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if len(buffer) - position > MAX_ITEM_CHARS:
+                raise
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                if buffer[position:].strip():
+                    raise
+                return
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        if end == len(buffer):
+            chunk = file.read(CHUNK_SIZE)
+            if chunk:
+                # Число на границе чанка могло быть прочитано не целиком.
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+        yield item
+        position = end
+
+
+def read_rows(path, fields, file_format=None):
+    """Построчно читает файл в словари с ключами ``fields``."""
+    file_format = get_format(path, file_format)
+    with open(path, newline='', encoding='utf8') as file:
+        if file_format == 'csv':
+            yield from read_csv(file, fields)
+        else:
+            for item in read_json(file):
+                yield {field: item.get(field) for field in fields}
+
+
+class Echo:
+    """Псевдо-файл для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class LineStream:
+    """Файлоподобный объект над генератором строк, например для COPY."""
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        chunks, length = [self.buffer], len(self.buffer)
+        while size < 0 or length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = ''.join(chunks)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def batched(iterable, size):
+    """Разбивает поток на списки длиной не больше ``size``."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
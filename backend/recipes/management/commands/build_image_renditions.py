@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recipes.images import build_renditions, executor
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Нарезка размеров фотографий рецептов, у которых их нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Нарезать заново для всех рецептов.',
+        )
+
+    def handle(self, *args, **options):
+        recipe_ids = [
+            recipe_id
+            for recipe_id, image, renditions in Recipe.objects.exclude(
+                image='',
+            ).exclude(image=None).values_list(
+                'id', 'image', 'image_renditions',
+            ).iterator()
+            if options['force'] or renditions.get('source') != image
+        ]
+        failed = 0
+        for recipe_id, error in zip(
+            recipe_ids, executor.map(self.build, recipe_ids),
+        ):
+            if error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {len(recipe_ids) - failed}, '
+            f'с ошибками: {failed}'
+        ))
+
+    def build(self, recipe_id):
+        try:
+            build_renditions(recipe_id)
+        except Exception as error:
+            return str(error)
+        finally:
+            close_old_connections()
@@ -0,0 +1,129 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.images import RENDITIONS_DIR
+from recipes.models import Recipe, StoredFile
+from recipes.storage import image_storage, short_digest
+
+IMAGES_DIR = 'recipes'
+
+
+class Command(BaseCommand):
+    help = 'Удаление фотографий рецептов, на которые больше нет ссылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help=(
+                'Минут без ссылок до удаления, защищает загрузки, '
+                'которые еще не сохранены в рецепт.'
+            ),
+        )
+        parser.add_argument(
+            '--scan',
+            action='store_true',
+            help=(
+                'Дополнительно найти в хранилище файлы, которые не '
+                'учтены в StoredFile, например загруженные до него.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.deadline = timezone.now() - timedelta(
+            minutes=options['min_age'],
+        )
+        self.removed = self.reclaimed = 0
+        self.collect_released()
+        if options['scan']:
+            self.collect_untracked()
+        action = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {self.removed}, '
+            f'освобождено: {self.reclaimed / 1024:.1f} КБ'
+        ))
+
+    def collect_released(self):
+        """Файлы, у которых счетчик ссылок упал до нуля."""
+        names = StoredFile.objects.filter(
+            refcount=0, updated_at__lt=self.deadline,
+        ).values_list('name', flat=True)
+        for name in names.iterator():
+            self.release(name)
+
+    @transaction.atomic
+    def release(self, name):
+        """Удаляет файл, пока его строка заблокирована.
+
+        Условие выборки проверяется заново под блокировкой: на файл
+        могли снова сослаться после чтения списка. Строки, которые
+        держит загрузка или другой сборщик, пропускаются.
+        """
+        stored = StoredFile.objects.select_for_update(
+            skip_locked=True,
+        ).filter(
+            name=name, refcount=0, updated_at__lt=self.deadline,
+        ).first()
+        if stored is None:
+            return
+        if image_storage.exists(name):
+            self.remove(default_storage, self.renditions(name))
+            self.remove(image_storage, [name])
+        if not self.dry_run:
+            stored.delete()
+
+    def collect_untracked(self):
+        """Файлы в хранилище без учета ссылок и без рецептов."""
+        tracked = set(StoredFile.objects.values_list('name', flat=True))
+        referenced = set()
+        for image, renditions in Recipe.objects.exclude(image='').values_list(
+            'image', 'image_renditions',
+        ).iterator():
+            referenced.add(image)
+            referenced.update(renditions.values())
+        for storage, directory in (
+            (image_storage, IMAGES_DIR),
+            (default_storage, RENDITIONS_DIR),
+        ):
+            if not storage.exists(directory):
+                continue
+            for file_name in storage.listdir(directory)[1]:
+                name = f'{directory}/{file_name}'
+                if name in tracked or name in referenced:
+                    continue
+                if storage.get_modified_time(name) < self.deadline:
+                    self.remove(storage, [name])
+
+    def renditions(self, name):
+        """Размеры, нарезанные из этого файла."""
+        hasher = hashlib.sha256()
+        with image_storage.open(name, 'rb') as file:
+            for chunk in file.chunks():
+                hasher.update(chunk)
+        digest = short_digest(hasher)
+        return [
+            f'{RENDITIONS_DIR}/{digest}-{rendition}.webp'
+            for rendition in settings.RECIPE_IMAGE_RENDITIONS
+        ]
+
+    def remove(self, storage, names):
+        for name in names:
+            if not storage.exists(name):
+                continue
+            self.removed += 1
+            self.reclaimed += storage.size(name)
+            if not self.dry_run:
+                storage.delete(name)
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.transfer import BATCH_SIZE, export_recipes
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка рецептов в NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки, по умолчанию stdout.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Рецептов в одном запросе.',
+        )
+
+    def handle(self, *args, **options):
+        lines = export_recipes(Recipe.objects.all(), options['batch_size'])
+        if not options['output']:
+            sys.stdout.writelines(lines)
+            return
+        with open(options['output'], 'w', encoding='utf8') as file:
+            file.writelines(lines)
+        self.stdout.write(self.style.SUCCESS('Выгрузка завершена'))
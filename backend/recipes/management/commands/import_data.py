@@ -1,63 +1,337 @@
 import csv
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
 
+import django
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+
+from api.caching import bump_recipes_version, invalidate_tags
+from recipes.ingredient_index import bump_version
+from recipes.loaders import FORMATS, Echo, LineStream, batched, read_rows
 from recipes.models import Ingredient, Tag, User
-from django.db import transaction
 
-CSV_PATH_INGREDIENTS = os.path.join(settings.BASE_DIR, 'data/ingredients.csv')
-CSV_PATH_USERS = os.path.join(settings.BASE_DIR, 'data/users.csv')
-CSV_PATH_TAGS = os.path.join(settings.BASE_DIR, 'data/tags.csv')
+DATA_DIR = os.path.join(settings.BASE_DIR, 'data')
+BATCH_SIZE = 5000
+COPY_NULL = r'\N'
+
+
+class Target(NamedTuple):
+    model: type[models.Model]
+    fields: tuple
+    unique_fields: tuple
+    update_fields: tuple
+    files: tuple
 
 
 class Command(BaseCommand):
-    help = 'Импорт данных из CSV в модель Ingredient'
-
-    def import_ingredients(self):
-        with open(CSV_PATH_INGREDIENTS, newline='', encoding='utf8') as file:
-            csv_reader = csv.reader(file)
-            data = []
-            next(csv_reader)
-            for row in csv_reader:
-                name, measurement_unit = row
-                ingredient = Ingredient(
-                    name=name,
-                    measurement_unit=measurement_unit,
-                )
-                data.append(ingredient)
-            Ingredient.objects.bulk_create(data)
-
-    def import_users(self):
-        with open(CSV_PATH_USERS, newline='', encoding='utf8') as file:
-            csv_reader = csv.reader(file)
-            data = []
-            next(csv_reader)
-            for row in csv_reader:
-                email, username, first_name, last_name, password = row
-                user = User(
-                    email=email,
-                    username=username,
-                    first_name=first_name,
-                    last_name=last_name,
-                )
-                data.append(user)
-            User.objects.bulk_create(data)
-
-    def import_tags(self):
-        with open(CSV_PATH_TAGS, newline='', encoding='utf8') as file:
-            csv_reader = csv.reader(file)
-            data = []
-            next(csv_reader)
-            for row in csv_reader:
-                name, color, slug = row
-                tag = Tag(name=name, color=color, slug=slug)
-                data.append(tag)
-            Tag.objects.bulk_create(data)
+    help = 'Импорт ингредиентов, тегов и пользователей из CSV или JSON'
+
+    targets = {
+        'ingredients': Target(
+            model=Ingredient,
+            fields=('name', 'measurement_unit'),
+            unique_fields=('name', 'measurement_unit'),
+            update_fields=(),
+            files=('ingredients.csv', 'ingredients.json'),
+        ),
+        'tags': Target(
+            model=Tag,
+            fields=('name', 'color', 'slug'),
+            unique_fields=('slug',),
+            update_fields=('name', 'color', 'updated_at'),
+            files=('tags.csv',),
+        ),
+        'users': Target(
+            model=User,
+            fields=('email', 'username', 'first_name', 'last_name',
+                    'password'),
+            unique_fields=('username',),
+            # Пароль задается только при создании: повторный импорт
+            # не сбрасывает пароли, измененные пользователями.
+            update_fields=('email', 'first_name', 'last_name'),
+            files=('users.csv',),
+        ),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'only',
+            nargs='*',
+            help=(
+                f'Что загружать: {", ".join(self.targets)}. '
+                'По умолчанию все справочники.'
+            ),
+        )
+        for target in self.targets:
+            parser.add_argument(
+                f'--{target}',
+                action='append',
+                metavar='PATH',
+                help=f'Файл для {target}, можно указать несколько раз.',
+            )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файлов, по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Строк в одном INSERT ... ON CONFLICT.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Процессов для хеширования паролей.',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help=(
+                'Загружать через COPY во временную таблицу и сливать '
+                'одним INSERT ... SELECT ... ON CONFLICT.'
+            ),
+        )
 
-    @transaction.atomic
     def handle(self, *args, **options):
-        self.import_ingredients()
-        self.import_users()
-        self.import_tags()
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        unknown = set(options['only']) - self.targets.keys()
+        if unknown:
+            raise CommandError(f'Неизвестные справочники: {unknown}')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError(
+                f'--copy поддерживается только для PostgreSQL, '
+                f'а не для {connection.vendor}.'
+            )
+        self.options = options
+        self.hashers = None
+        try:
+            for name in options['only'] or self.targets:
+                self.import_target(name, self.targets[name])
+        finally:
+            if self.hashers is not None:
+                self.hashers.shutdown()
+        bump_version()
+        invalidate_tags()
+        bump_recipes_version()
         self.stdout.write(self.style.SUCCESS('Импорт завершен'))
+
+    def import_target(self, name, target):
+        paths = self.options[name] or [
+            os.path.join(DATA_DIR, file) for file in target.files
+        ]
+        total, started = 0, time.monotonic()
+        for path in paths:
+            rows = read_rows(path, target.fields, self.options['format'])
+            try:
+                if self.options['copy']:
+                    total += self.copy(target, rows)
+                    continue
+                for batch in batched(rows, self.options['batch_size']):
+                    total += self.upsert(target, batch)
+            except ValueError as error:
+                raise CommandError(f'{path}: {error}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{name}: {total} строк за {elapsed:.1f} с '
+            f'({total / max(elapsed, 1e-9):.0f} строк/с)'
+        )
+
+    def upsert(self, target, rows):
+        """Один INSERT ... ON CONFLICT на пачку строк."""
+        # ON CONFLICT DO UPDATE не может изменить строку дважды
+        # за один запрос, поэтому в пачке остается последний дубликат.
+        rows = list({
+            tuple(row[field] for field in target.unique_fields): row
+            for row in rows
+        }.values())
+        if target.model is User:
+            self.hash_passwords(rows)
+        objs = [target.model(**row) for row in rows]
+        if target.update_fields:
+            target.model.objects.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=target.unique_fields,
+                update_fields=target.update_fields,
+            )
+        else:
+            target.model.objects.bulk_create(objs, ignore_conflicts=True)
+        return len(objs)
+
+    def hash_passwords(self, rows):
+        """Хеширует пароли новых пользователей пачки в пуле процессов.
+
+        Существующим пользователям пароль не обновляется, им ставится
+        дешевая заглушка, которая не попадет в базу.
+        """
+        existing = set(User.objects.filter(
+            username__in=[row['username'] for row in rows],
+        ).values_list('username', flat=True))
+        unusable = make_password(None)
+        new_rows = []
+        for row in rows:
+            if row['username'] in existing:
+                row['password'] = unusable
+            else:
+                new_rows.append(row)
+        passwords = self.make_passwords(
+            [row['password'] for row in new_rows],
+        )
+        for row, password in zip(new_rows, passwords):
+            row['password'] = password
+
+    def make_passwords(self, passwords):
+        """Хеши паролей, параллельно в пуле процессов."""
+        if not passwords:
+            return []
+        if self.hashers is None:
+            self.hashers = ProcessPoolExecutor(
+                max_workers=self.options['workers'],
+                initializer=django.setup,
+            )
+        return list(self.hashers.map(
+            make_password,
+            [password or None for password in passwords],
+            chunksize=max(
+                len(passwords) // (self.options['workers'] * 4), 1,
+            ),
+        ))
+
+    @transaction.atomic
+    def copy(self, target, rows):
+        """Загрузка файла через временную таблицу.
+
+        Строки передаются одним COPY FROM STDIN, слияние в целевую
+        таблицу выполняет один INSERT ... SELECT ... ON CONFLICT.
+        """
+        quote_name = connection.ops.quote_name
+        opts = target.model._meta
+        staging = quote_name(f'{opts.db_table}_staging')
+        columns = [opts.get_field(field).column for field in target.fields]
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {staging}')
+            cursor.execute(
+                'CREATE TEMPORARY TABLE {staging} '
+                '(id bigserial PRIMARY KEY, {columns})'.format(
+                    staging=staging,
+                    columns=', '.join(
+                        f'{quote_name(column)} text' for column in columns
+                    ),
+                )
+            )
+            self.fill_staging(cursor, staging, columns, target, rows)
+            if target.model is User:
+                self.hash_staged_passwords(cursor, staging)
+            cursor.execute(f'SELECT COUNT(*) FROM {staging}')
+            total = cursor.fetchone()[0]
+            cursor.execute(*self.merge_sql(target, staging, columns))
+            cursor.execute(f'DROP TABLE {staging}')
+        return total
+
+    def hash_staged_passwords(self, cursor, staging):
+        """Хеширует во временной таблице пароли только новых пользователей.
+
+        Строкам существующих пользователей ставится заглушка, слияние
+        пароль не обновляет. Читается пачками по id временной таблицы.
+        """
+        quote_name = connection.ops.quote_name
+        existing = '{username} IN (SELECT {username} FROM {users})'.format(
+            username=quote_name('username'),
+            users=quote_name(User._meta.db_table),
+        )
+        cursor.execute(
+            f'UPDATE {staging} SET {quote_name("password")} = %s '
+            f'WHERE {existing}',
+            [make_password(None)],
+        )
+        last_id = 0
+        while True:
+            cursor.execute(
+                f'SELECT id, {quote_name("password")} FROM {staging} '
+                f'WHERE id > %s AND NOT {existing} ORDER BY id LIMIT %s',
+                [last_id, self.options['batch_size']],
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            staging_ids, passwords = zip(*rows)
+            cursor.executemany(
+                f'UPDATE {staging} SET {quote_name("password")} = %s '
+                'WHERE id = %s',
+                list(zip(self.make_passwords(passwords), staging_ids)),
+            )
+
+    def fill_staging(self, cursor, staging, columns, target, rows):
+        writer = csv.writer(Echo())
+        lines = (
+            writer.writerow([
+                COPY_NULL if row[field] is None else row[field]
+                for field in target.fields
+            ])
+            for row in rows
+        )
+        cursor.copy_expert(
+            'COPY {staging} ({columns}) FROM STDIN '
+            "WITH (FORMAT csv, NULL '{null}')".format(
+                staging=staging,
+                columns=', '.join(map(connection.ops.quote_name, columns)),
+                null=COPY_NULL,
+            ),
+            LineStream(lines),
+        )
+
+    def merge_sql(self, target, staging, columns):
+        """INSERT ... SELECT ... ON CONFLICT из временной таблицы.
+
+        Из дубликатов по ключу остается последняя строка файла, поля,
+        которых нет в файле, заполняются значениями по умолчанию модели.
+        """
+        quote_name = connection.ops.quote_name
+        opts = target.model._meta
+        instance = target.model()
+        defaults = {
+            field.column: field.get_db_prep_save(
+                field.pre_save(instance, add=True), connection,
+            )
+            for field in opts.concrete_fields
+            if not field.primary_key and field.name not in target.fields
+        }
+        keys = ', '.join(
+            quote_name(opts.get_field(field).column)
+            for field in target.unique_fields
+        )
+        if target.update_fields:
+            conflict = 'DO UPDATE SET ' + ', '.join(
+                '{column} = EXCLUDED.{column}'.format(
+                    column=quote_name(opts.get_field(field).column),
+                )
+                for field in target.update_fields
+            )
+        else:
+            conflict = 'DO NOTHING'
+        sql = (
+            'INSERT INTO {table} ({columns}) '
+            'SELECT {values} FROM {staging} '
+            'WHERE id IN (SELECT MAX(id) FROM {staging} GROUP BY {keys}) '
+            'ON CONFLICT ({keys}) {conflict}'
+        ).format(
+            table=quote_name(opts.db_table),
+            columns=', '.join(map(quote_name, [*columns, *defaults])),
+            values=', '.join(
+                [*map(quote_name, columns)] + ['%s'] * len(defaults)
+            ),
+            staging=staging,
+            keys=keys,
+            conflict=conflict,
+        )
+        return sql, list(defaults.values())
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.loaders import read_lines
+from recipes.transfer import BATCH_SIZE, RecipeImporter
+
+
+class Command(BaseCommand):
+    help = 'Загрузка рецептов из NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON с рецептами.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Рецептов в одной пачке вставок.',
+        )
+
+    def handle(self, *args, **options):
+        importer = RecipeImporter(
+            options['batch_size'],
+            on_error=lambda line, error: self.stderr.write(
+                f'Строка {line}: {error}'
+            ),
+        )
+        started = time.monotonic()
+        with open(options['path'], encoding='utf8') as file:
+            importer.run(read_lines(file))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рецептов: {importer.created}, '
+            f'уже были: {importer.existing}, с ошибками: {importer.invalid} '
+            f'({importer.created / max(elapsed, 1e-9):.0f} рецептов/с)'
+        ))
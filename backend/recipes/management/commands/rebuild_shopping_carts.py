@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingCartItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Пересчет агрегированных списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя данные.',
+        )
+
+    def get_expected(self):
+        return {
+            (row['recipes__purchases__user'], row['ingredients']): row['total']
+            for row in ShoppingCartItem.objects.expected_amounts().iterator()
+        }
+
+    def get_drift(self, expected):
+        actual = dict(
+            ((user_id, ingredient_id), amount)
+            for user_id, ingredient_id, amount
+            in ShoppingCartItem.objects.values_list(
+                'user_id', 'ingredients_id', 'amount',
+            ).iterator()
+        )
+        return {
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        }
+
+    @transaction.atomic
+    def rebuild(self, expected):
+        ShoppingCartItem.objects.all().delete()
+        ShoppingCartItem.objects.bulk_create(
+            [
+                ShoppingCartItem(
+                    user_id=user_id,
+                    ingredients_id=ingredient_id,
+                    amount=amount,
+                )
+                for (user_id, ingredient_id), amount in expected.items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        expected = self.get_expected()
+        drift = self.get_drift(expected)
+        if options['check']:
+            style = self.style.WARNING if drift else self.style.SUCCESS
+            self.stdout.write(style(f'Расхождений найдено: {len(drift)}'))
+            return
+        self.rebuild(expected)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны, исправлено: {len(drift)}'
+        ))
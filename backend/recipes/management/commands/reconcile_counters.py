@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from recipes.models import AuthorCounter, Recipe, User
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Сверка денормализованных счетчиков с фактическими данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя данные.',
+        )
+
+    def get_recipe_drift(self):
+        recipes = Recipe.objects.order_by().annotate(
+            actual_favorites=Count('favorites', distinct=True),
+            actual_in_carts=Count('purchases', distinct=True),
+        ).only('id', 'favorites_count', 'in_carts_count')
+        drift = []
+        for recipe in recipes.iterator():
+            if (
+                recipe.favorites_count != recipe.actual_favorites
+                or recipe.in_carts_count != recipe.actual_in_carts
+            ):
+                recipe.favorites_count = recipe.actual_favorites
+                recipe.in_carts_count = recipe.actual_in_carts
+                drift.append(recipe)
+        return drift
+
+    def get_author_drift(self):
+        current = {
+            counter.user_id: counter
+            for counter in AuthorCounter.objects.iterator()
+        }
+        users = User.objects.order_by().annotate(
+            actual_recipes=Count('recipes', distinct=True),
+            actual_followers=Count('following', distinct=True),
+        ).values_list('id', 'actual_recipes', 'actual_followers')
+        drift = []
+        for user_id, recipes_count, followers_count in users.iterator():
+            counter = current.get(user_id)
+            if counter is None and not (recipes_count or followers_count):
+                continue
+            if counter is not None and (
+                counter.recipes_count == recipes_count
+                and counter.followers_count == followers_count
+            ):
+                continue
+            drift.append(AuthorCounter(
+                user_id=user_id,
+                recipes_count=recipes_count,
+                followers_count=followers_count,
+            ))
+        return drift
+
+    @transaction.atomic
+    def fix(self, recipe_drift, author_drift):
+        Recipe.objects.bulk_update(
+            recipe_drift,
+            ['favorites_count', 'in_carts_count'],
+            batch_size=BATCH_SIZE,
+        )
+        AuthorCounter.objects.bulk_create(
+            author_drift,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['recipes_count', 'followers_count'],
+            batch_size=BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        recipe_drift = self.get_recipe_drift()
+        author_drift = self.get_author_drift()
+        total = len(recipe_drift) + len(author_drift)
+        if options['check']:
+            style = self.style.WARNING if total else self.style.SUCCESS
+            self.stdout.write(style(f'Расхождений найдено: {total}'))
+            return
+        self.fix(recipe_drift, author_drift)
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны, исправлено: {total}'
+        ))
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.6 on 2026-10-18 05:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_carts(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartItem = apps.get_model('recipes', 'ShoppingCartItem')
+    totals = RecipeIngredient.objects.filter(
+        recipes__purchases__isnull=False,
+    ).values(
+        'recipes__purchases__user', 'ingredients',
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingCartItem.objects.bulk_create(
+        (
+            ShoppingCartItem(
+                user_id=row['recipes__purchases__user'],
+                ingredients_id=row['ingredients'],
+                amount=row['total'],
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0005_alter_recipe_cooking_time_alter_recipe_text_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={'ordering': ['-created_at'], 'verbose_name': 'рецепт', 'verbose_name_plural': 'рецепты'},
+        ),
+        migrations.CreateModel(
+            name='ShoppingCartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('amount', models.PositiveIntegerField(default=0, verbose_name='количество')),
+                ('ingredients', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_items', to='recipes.ingredient', verbose_name='ингредиенты')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_items', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredients'), name='unique_shopping_cart_user_ingredients'),
+        ),
+        migrations.RunPython(
+            fill_shopping_carts, migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-18 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_ingredient_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['created_at', 'id'], name='recipe_created_at_id'),
+        ),
+    ]
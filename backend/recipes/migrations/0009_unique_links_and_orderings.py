@@ -0,0 +1,117 @@
+# Generated by Django 4.2.6 on 2026-10-18 05:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+UNIQUE_LINKS = (
+    ('Favorite', ('user', 'recipes')),
+    ('Purchase', ('user', 'recipes')),
+    ('RecipeIngredient', ('recipes', 'ingredients')),
+    ('RecipeTag', ('recipes', 'tags')),
+)
+
+
+def remove_duplicates(apps, schema_editor):
+    """Оставляет самую раннюю строку из каждой группы дубликатов."""
+    removed = {}
+    for model_name, fields in UNIQUE_LINKS:
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values(*fields).annotate(
+            keep_id=models.Min('id'),
+            rows_count=models.Count('id'),
+        ).filter(rows_count__gt=1).order_by()
+        removed[model_name] = 0
+        for row in duplicates.iterator():
+            deleted, _ = model.objects.filter(
+                **{field: row[field] for field in fields}
+            ).exclude(id=row['keep_id']).delete()
+            removed[model_name] += deleted
+    if removed['Purchase'] or removed['RecipeIngredient']:
+        rebuild_shopping_carts(apps)
+
+
+def rebuild_shopping_carts(apps):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartItem = apps.get_model('recipes', 'ShoppingCartItem')
+    ShoppingCartItem.objects.all().delete()
+    totals = RecipeIngredient.objects.filter(
+        recipes__purchases__isnull=False,
+    ).values(
+        'recipes__purchases__user', 'ingredients',
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingCartItem.objects.bulk_create(
+        (
+            ShoppingCartItem(
+                user_id=row['recipes__purchases__user'],
+                ingredients_id=row['ingredients'],
+                amount=row['total'],
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_created_at_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='favorite',
+            options={'verbose_name': 'избранное', 'verbose_name_plural': 'избранные'},
+        ),
+        migrations.AlterModelOptions(
+            name='purchase',
+            options={'verbose_name': 'Покупка', 'verbose_name_plural': 'Покупки'},
+        ),
+        migrations.AlterModelOptions(
+            name='recipeingredient',
+            options={'verbose_name': 'Ингредиент-рецепт', 'verbose_name_plural': 'Ингредиенты-рецепты'},
+        ),
+        migrations.AlterModelOptions(
+            name='recipetag',
+            options={'verbose_name': 'Тэг рецепта', 'verbose_name_plural': 'Теги рецептов'},
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+        migrations.AlterField(
+            model_name='purchase',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='purchases', to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='recipes',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipe_ingredients', to='recipes.recipe', verbose_name='рецепты'),
+        ),
+        migrations.AlterField(
+            model_name='recipetag',
+            name='recipes',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipes'), name='unique_favorite_user_recipes'),
+        ),
+        migrations.AddConstraint(
+            model_name='purchase',
+            constraint=models.UniqueConstraint(fields=('user', 'recipes'), name='unique_purchase_user_recipes'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipes', 'ingredients'), name='unique_recipeingredient_recipes_ingredients'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipetag',
+            constraint=models.UniqueConstraint(fields=('recipes', 'tags'), name='unique_recipetag_recipes_tags'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.6 on 2026-10-18 05:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    AuthorCounter = apps.get_model('recipes', 'AuthorCounter')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Recipe.objects.update(
+        favorites_count=models.Subquery(
+            Recipe.objects.filter(pk=models.OuterRef('pk')).annotate(
+                total=models.Count('favorites'),
+            ).values('total')
+        ),
+        in_carts_count=models.Subquery(
+            Recipe.objects.filter(pk=models.OuterRef('pk')).annotate(
+                total=models.Count('purchases'),
+            ).values('total')
+        ),
+    )
+    counters = User.objects.annotate(
+        total_recipes=models.Count('recipes', distinct=True),
+        total_followers=models.Count('following', distinct=True),
+    ).filter(
+        models.Q(total_recipes__gt=0) | models.Q(total_followers__gt=0)
+    ).values_list('id', 'total_recipes', 'total_followers').order_by()
+    AuthorCounter.objects.bulk_create(
+        (
+            AuthorCounter(
+                user_id=user_id,
+                recipes_count=recipes_count,
+                followers_count=followers_count,
+            )
+            for user_id, recipes_count, followers_count in counters.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_unique_links_and_orderings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+                ('recipes_count', models.PositiveIntegerField(default=0, verbose_name='рецептов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='подписчиков')),
+            ],
+            options={
+                'verbose_name': 'Счетчики автора',
+                'verbose_name_plural': 'Счетчики авторов',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['favorites_count', 'created_at', 'id'], name='recipe_popular'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.6 on 2026-10-18 05:53
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Переносит ссылки на самый ранний из одинаковых ингредиентов."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartItem = apps.get_model('recipes', 'ShoppingCartItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit',
+    ).annotate(
+        keep_id=models.Min('id'),
+        rows_count=models.Count('id'),
+    ).filter(rows_count__gt=1).order_by()
+    for row in duplicates.iterator():
+        duplicate_ids = list(Ingredient.objects.filter(
+            name=row['name'], measurement_unit=row['measurement_unit'],
+        ).exclude(id=row['keep_id']).values_list('id', flat=True))
+        for model, owner in (
+            (RecipeIngredient, 'recipes'),
+            (ShoppingCartItem, 'user'),
+        ):
+            for link in model.objects.filter(
+                ingredients_id__in=duplicate_ids,
+            ).iterator():
+                kept = model.objects.filter(
+                    **{owner: getattr(link, f'{owner}_id')},
+                    ingredients_id=row['keep_id'],
+                ).update(amount=models.F('amount') + link.amount)
+                if kept:
+                    link.delete()
+                else:
+                    link.ingredients_id = row['keep_id']
+                    link.save(update_fields=['ingredients'])
+        Ingredient.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop,
+        ),
+    ]
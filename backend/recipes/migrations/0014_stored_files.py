@@ -0,0 +1,49 @@
+# Generated by Django 4.2.6 on 2026-10-18 06:02
+
+from django.db import migrations, models
+import recipes.storage
+
+
+def count_references(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    StoredFile = apps.get_model('recipes', 'StoredFile')
+    references = Recipe.objects.exclude(image='').exclude(
+        image=None,
+    ).values('image').annotate(total=models.Count('id')).order_by()
+    StoredFile.objects.bulk_create(
+        (
+            StoredFile(name=row['image'], refcount=row['total'])
+            for row in references.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(default=None, null=True, storage=recipes.storage.get_image_storage, upload_to='recipes/', verbose_name='Фотография блюда'),
+        ),
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='имя файла')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+                'indexes': [models.Index(condition=models.Q(('refcount', 0)), fields=['updated_at'], name='storedfile_orphans')],
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
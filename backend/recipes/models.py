@@ -1,13 +1,40 @@
+from collections import Counter
+
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.core.exceptions import EmptyResultSet, ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import Greatest, Lower
+from django.utils import timezone
 
+from .storage import get_image_storage
 from .validators import validate_color, validate_slug
 
 User = get_user_model()
 
 
+def group_by_count(ids):
+    """Группирует id по числу их повторений: {повторы: [id, ...]}."""
+    groups = {}
+    for id, times in Counter(ids).items():
+        groups.setdefault(times, []).append(id)
+    return groups
+
+
+def change_counter(queryset, key_field, keys, field, delta, **fields):
+    """Атомарно меняет счетчик на delta для каждого вхождения ключа.
+
+    Один UPDATE на группу ключей с одинаковым числом повторений,
+    счетчик не опускается ниже нуля. ``fields`` обновляются вместе с ним.
+    """
+    for times, group in group_by_count(keys).items():
+        queryset.filter(**{f'{key_field}__in': group}).update(
+            **{field: Greatest(models.F(field) + delta * times, 0)},
+            **fields,
+        )
+
+
 class CommonInfoBaseModel(models.Model):
     """Абстрактная модель."""
 
@@ -41,6 +68,23 @@ class Ingredient(CommonInfoBaseModel):
         ordering = ['name']
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_unit',
+            ),
+        ]
+
+        indexes = [
+            models.Index(
+                OpClass(Lower('name'), name='text_pattern_ops'),
+                name='ingredient_name_lower_like',
+            ),
+            GinIndex(
+                OpClass(Lower('name'), name='gin_trgm_ops'),
+                name='ingredient_name_lower_trgm',
+            ),
+        ]
 
     def __str__(self):
         """Строковое представление названия ингредиента."""
@@ -81,6 +125,17 @@ class Tag(CommonInfoBaseModel):
         return self.name
 
 
+class RecipeManager(models.Manager):
+
+    def change_counter(self, recipe_ids, field, delta):
+        """Атомарно меняет счетчик на delta для каждого вхождения id."""
+        change_counter(self.all(), 'id', recipe_ids, field, delta)
+
+    def touch(self, recipe_ids):
+        """Обновляет updated_at, например после правки состава рецепта."""
+        self.filter(id__in=recipe_ids).update(updated_at=timezone.now())
+
+
 class Recipe(CommonInfoBaseModel):
     """Рецепты."""
 
@@ -97,6 +152,7 @@ class Recipe(CommonInfoBaseModel):
     )
     image = models.ImageField(
         upload_to='recipes/',
+        storage=get_image_storage,
         verbose_name='Фотография блюда',
         null=True,
         default=None,
@@ -120,6 +176,23 @@ class Recipe(CommonInfoBaseModel):
         validators=[MinValueValidator(1)],
         verbose_name='время приготовления'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='в избранном',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='в списках покупок',
+    )
+    image_renditions = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='размеры фотографии',
+    )
+
+    objects = RecipeManager()
 
     class Meta:
         """Мета класс."""
@@ -128,9 +201,55 @@ class Recipe(CommonInfoBaseModel):
         verbose_name = "рецепт"
         verbose_name_plural = "рецепты"
 
+        indexes = [
+            models.Index(
+                fields=['created_at', 'id'],
+                name='recipe_created_at_id',
+            ),
+            models.Index(
+                fields=['favorites_count', 'created_at', 'id'],
+                name='recipe_popular',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
+    def get_image(self, rendition):
+        """Файл фотографии нужного размера.
+
+        Пока размеры для текущей фотографии не нарезаны, отдается оригинал.
+        """
+        renditions = self.image_renditions
+        if renditions.get('source') != self.image.name:
+            return self.image
+        name = renditions.get(rendition)
+        if not name:
+            return self.image
+        return self.image.field.attr_class(self, self.image.field, name)
+
+
+class RecipeIngredientManager(models.Manager):
+
+    def delete_rows(self, ids):
+        """Один DELETE по id без сигналов.
+
+        Вызывающий код сам правит корзины, как сериализатор рецепта.
+        """
+        if not ids:
+            return 0
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        opts = self.model._meta
+        sql = 'DELETE FROM {table} WHERE {pk} IN ({ids})'.format(
+            table=quote_name(opts.db_table),
+            pk=quote_name(opts.pk.column),
+            ids=', '.join(['%s'] * len(ids)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, list(ids))
+            return cursor.rowcount
+
 
 class RecipeIngredient(CommonInfoBaseModel):
     """Связывающая модель для ManyToMany."""
@@ -140,6 +259,7 @@ class RecipeIngredient(CommonInfoBaseModel):
         on_delete=models.CASCADE,
         verbose_name='рецепты',
         related_name='recipe_ingredients',
+        db_index=False,
     )
     ingredients = models.ForeignKey(
         Ingredient,
@@ -151,17 +271,102 @@ class RecipeIngredient(CommonInfoBaseModel):
         validators=[MinValueValidator(1)]
     )
 
+    objects = RecipeIngredientManager()
+
     class Meta:
         """Мета класс."""
 
-        ordering = ['created_at']
         verbose_name = "Ингредиент-рецепт"
         verbose_name_plural = "Ингредиенты-рецепты"
 
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipes', 'ingredients'],
+                name='unique_recipeingredient_recipes_ingredients'
+            )
+        ]
+
     def __str__(self):
         return f'{self.recipes} - {self.ingredients}, {self.amount}.'
 
 
+class UniqueLinkManager(models.Manager):
+    """Создание и удаление уникальных связей одним запросом.
+
+    Модель задает поле цели связи ``link_target`` и метод
+    ``change_counters(target_ids, delta)`` для денормализованных счетчиков.
+    """
+
+    def link(self, **fields):
+        """INSERT ... ON CONFLICT DO NOTHING, True если строка добавлена."""
+        return bool(self.link_many([fields]))
+
+    def link_many(self, rows):
+        """Вставляет строки одним запросом, пропуская существующие.
+
+        Возвращает id целей только добавленных связей.
+        """
+        if not rows:
+            return []
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        opts = self.model._meta
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        names = list(rows[0])
+        columns = ['created_at', 'updated_at'] + [
+            opts.get_field(name).column for name in names
+        ]
+        placeholders = '({})'.format(', '.join(['%s'] * len(columns)))
+        params = []
+        for row in rows:
+            params += [now, now] + [row[name] for name in names]
+        sql = (
+            'INSERT INTO {table} ({columns}) VALUES {values} '
+            'ON CONFLICT DO NOTHING RETURNING {target}'
+        ).format(
+            table=quote_name(opts.db_table),
+            columns=', '.join(map(quote_name, columns)),
+            values=', '.join([placeholders] * len(rows)),
+            target=quote_name(opts.get_field(self.model.link_target).column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            target_ids = [row[0] for row in cursor.fetchall()]
+        self.model.change_counters(target_ids, 1)
+        return target_ids
+
+    def unlink(self, **fields):
+        """Один DELETE, True если связь существовала."""
+        return bool(self.unlink_many(**fields))
+
+    def unlink_many(self, **filters):
+        """Один DELETE ... RETURNING, id целей удаленных связей."""
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        opts = self.model._meta
+        try:
+            subquery, params = self.filter(**filters).values(
+                'pk'
+            ).query.sql_with_params()
+        except EmptyResultSet:
+            # Фильтр заведомо пуст, например id__in=[].
+            return []
+        sql = (
+            'DELETE FROM {table} WHERE {pk} IN ({subquery}) '
+            'RETURNING {target}'
+        ).format(
+            table=quote_name(opts.db_table),
+            pk=quote_name(opts.pk.column),
+            subquery=subquery,
+            target=quote_name(opts.get_field(self.model.link_target).column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            target_ids = [row[0] for row in cursor.fetchall()]
+        self.model.change_counters(target_ids, -1)
+        return target_ids
+
+
 class Follow(CommonInfoBaseModel):
     """Подписки."""
 
@@ -178,6 +383,9 @@ class Follow(CommonInfoBaseModel):
         verbose_name='подписчик',
     )
 
+    objects = UniqueLinkManager()
+    link_target = 'following'
+
     class Meta:
         """Мета класс."""
 
@@ -192,6 +400,10 @@ class Follow(CommonInfoBaseModel):
             )
         ]
 
+    @classmethod
+    def change_counters(cls, target_ids, delta):
+        AuthorCounter.objects.change(target_ids, 'followers_count', delta)
+
     def clean(self) -> None:
         if self.following == self.user:
             raise ValidationError("Нельзя подписаться на самого себя!")
@@ -209,6 +421,7 @@ class Purchase(CommonInfoBaseModel):
         on_delete=models.CASCADE,
         related_name="purchases",
         verbose_name="пользователь",
+        db_index=False,
     )
 
     recipes = models.ForeignKey(
@@ -218,12 +431,25 @@ class Purchase(CommonInfoBaseModel):
         verbose_name="рецепты",
     )
 
+    objects = UniqueLinkManager()
+    link_target = 'recipes'
+
     class Meta:
         """Мета класс."""
-        ordering = ['user']
         verbose_name = "Покупка"
         verbose_name_plural = "Покупки"
 
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipes'],
+                name='unique_purchase_user_recipes'
+            )
+        ]
+
+    @classmethod
+    def change_counters(cls, target_ids, delta):
+        Recipe.objects.change_counter(target_ids, 'in_carts_count', delta)
+
 
 class Favorite(CommonInfoBaseModel):
     """Избранные рецепты пользователя."""
@@ -233,6 +459,7 @@ class Favorite(CommonInfoBaseModel):
         on_delete=models.CASCADE,
         related_name="favorites",
         verbose_name="пользователь",
+        db_index=False,
     )
 
     recipes = models.ForeignKey(
@@ -242,25 +469,266 @@ class Favorite(CommonInfoBaseModel):
         verbose_name="рецепты",
     )
 
+    objects = UniqueLinkManager()
+    link_target = 'recipes'
+
     class Meta:
         """Мета класс."""
-        ordering = ['user']
         verbose_name = "избранное"
         verbose_name_plural = "избранные"
 
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipes'],
+                name='unique_favorite_user_recipes'
+            )
+        ]
+
+    @classmethod
+    def change_counters(cls, target_ids, delta):
+        Recipe.objects.change_counter(target_ids, 'favorites_count', delta)
+
     def __str__(self):
         return f'{self.user} likes {self.recipes}'
 
 
 class RecipeTag(CommonInfoBaseModel):
-    recipes = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    recipes = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, db_index=False,
+    )
     tags = models.ForeignKey(Tag, on_delete=models.CASCADE)
 
     class Meta:
         """Мета класс."""
-        ordering = ['created_at']
         verbose_name = "Тэг рецепта"
         verbose_name_plural = "Теги рецептов"
 
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipes', 'tags'],
+                name='unique_recipetag_recipes_tags'
+            )
+        ]
+
     def __str__(self):
         return f'{self.recipes} {self.tags}'
+
+
+class ShoppingCartItemManager(models.Manager):
+    """Инкрементальное обновление агрегированных списков покупок."""
+
+    def recipe_amounts(self, recipe):
+        """Количества ингредиентов рецепта по id ингредиента."""
+        amounts = Counter()
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipes=recipe,
+        ).order_by().values_list('ingredients_id', 'amount'):
+            amounts[ingredient_id] += amount
+        return amounts
+
+    def add_recipe(self, recipe, user_ids, amounts=None, sign=1):
+        """Добавляет (sign=-1 - вычитает) рецепт в корзины пользователей."""
+        if amounts is None:
+            amounts = self.recipe_amounts(recipe)
+        deltas = Counter()
+        for user_id in user_ids:
+            for ingredient_id, amount in amounts.items():
+                deltas[(user_id, ingredient_id)] += sign * amount
+        self.apply_amounts(deltas)
+
+    def remove_recipe(self, recipe, user_ids, amounts=None):
+        self.add_recipe(recipe, user_ids, amounts, sign=-1)
+
+    def add_ingredient(self, recipe_id, ingredient_id, amount):
+        """Меняет количество ингредиента рецепта во всех его корзинах."""
+        self.add_recipe(
+            recipe_id,
+            Purchase.objects.filter(recipes_id=recipe_id).values_list(
+                'user_id', flat=True,
+            ),
+            amounts={ingredient_id: amount},
+        )
+
+    def add_recipes(self, recipe_ids, user_id, sign=1):
+        """Добавляет (sign=-1 - вычитает) рецепты в корзину пользователя."""
+        deltas = Counter()
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipes__in=recipe_ids,
+        ).order_by().values_list('ingredients_id', 'amount'):
+            deltas[(user_id, ingredient_id)] += sign * amount
+        self.apply_amounts(deltas)
+
+    @transaction.atomic
+    def apply_amounts(self, deltas):
+        """Применяет изменения количеств по ключам (user_id, ingredient_id)."""
+        deltas = {key: amount for key, amount in deltas.items() if amount}
+        if not deltas:
+            return
+        # Строки вставляются и блокируются в одном порядке, иначе
+        # встречные правки пересекающихся корзин могут взаимно заблокироваться.
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredients_id=ingredient_id)
+                for (user_id, ingredient_id), amount in sorted(deltas.items())
+                if amount > 0
+            ],
+            ignore_conflicts=True,
+        )
+        items = self.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in deltas},
+            ingredients_id__in={ingredient_id for _, ingredient_id in deltas},
+        ).order_by('user_id', 'ingredients_id')
+        changed, emptied = [], []
+        for item in items:
+            amount = deltas.get((item.user_id, item.ingredients_id))
+            if amount is None:
+                continue
+            item.amount = max(item.amount + amount, 0)
+            if item.amount:
+                changed.append(item)
+            else:
+                emptied.append(item.pk)
+        if changed:
+            self.bulk_update(changed, ['amount'])
+        if emptied:
+            self.filter(pk__in=emptied).delete()
+
+    def expected_amounts(self):
+        """Агрегат корзин, посчитанный заново по покупкам пользователей."""
+        return RecipeIngredient.objects.filter(
+            recipes__purchases__isnull=False,
+        ).values(
+            'recipes__purchases__user', 'ingredients',
+        ).annotate(
+            total=models.Sum('amount'),
+        ).order_by()
+
+
+class ShoppingCartItem(CommonInfoBaseModel):
+    """Агрегированный список покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_items",
+        verbose_name="пользователь",
+    )
+    ingredients = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_items",
+        verbose_name="ингредиенты",
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='количество',
+    )
+
+    objects = ShoppingCartItemManager()
+
+    class Meta:
+        """Мета класс."""
+
+        verbose_name = "Ингредиент списка покупок"
+        verbose_name_plural = "Списки покупок"
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredients'],
+                name='unique_shopping_cart_user_ingredients'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredients}, {self.amount}.'
+
+
+class AuthorCounterManager(models.Manager):
+
+    def change(self, user_ids, field, delta):
+        """Атомарно меняет счетчик на delta для каждого вхождения id."""
+        if delta > 0:
+            self.bulk_create(
+                [self.model(user_id=user_id) for user_id in set(user_ids)],
+                ignore_conflicts=True,
+            )
+        change_counter(self.all(), 'user_id', user_ids, field, delta)
+
+
+class AuthorCounter(models.Model):
+    """Денормализованные счетчики автора."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='пользователь',
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='подписчиков',
+    )
+
+    objects = AuthorCounterManager()
+
+    class Meta:
+        """Мета класс."""
+
+        verbose_name = "Счетчики автора"
+        verbose_name_plural = "Счетчики авторов"
+
+    def __str__(self):
+        return f'{self.user}: {self.recipes_count}, {self.followers_count}'
+
+
+class StoredFileManager(models.Manager):
+
+    def change(self, names, delta):
+        """Атомарно меняет число ссылок на delta для каждого вхождения."""
+        names = [name for name in names if name]
+        if delta > 0:
+            self.bulk_create(
+                [self.model(name=name) for name in set(names)],
+                ignore_conflicts=True,
+            )
+        change_counter(
+            self.all(), 'name', names, 'refcount', delta,
+            updated_at=timezone.now(),
+        )
+
+
+class StoredFile(CommonInfoBaseModel):
+    """Число рецептов, ссылающихся на файл в хранилище изображений."""
+
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name='имя файла',
+    )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='ссылок',
+    )
+
+    objects = StoredFileManager()
+
+    class Meta:
+        """Мета класс."""
+
+        verbose_name = "Файл изображения"
+        verbose_name_plural = "Файлы изображений"
+        indexes = [
+            models.Index(
+                fields=['updated_at'],
+                condition=models.Q(refcount=0),
+                name='storedfile_orphans',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name}: {self.refcount}'
@@ -0,0 +1,163 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .images import schedule_renditions
+from .ingredient_index import bump_version
+from .models import (AuthorCounter, Favorite, Follow, Ingredient, Purchase,
+                     Recipe, RecipeIngredient, RecipeTag, ShoppingCartItem,
+                     StoredFile)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_carts(sender, instance, **kwargs):
+    """Вычитает удаляемый рецепт из списков покупок."""
+    user_ids = list(instance.purchases.values_list('user_id', flat=True))
+    if user_ids:
+        ShoppingCartItem.objects.remove_recipe(instance, user_ids)
+
+
+def deleted_directly(sender, origin):
+    """Удаление самой связи, а не каскад от рецепта или пользователя.
+
+    Каскады корзины не трогают: рецепт вычитается из них в
+    ``remove_recipe_from_shopping_carts``, а корзины удаленного
+    пользователя удаляются вместе с ним.
+    """
+    if isinstance(origin, QuerySet):
+        return origin.model is sender
+    return isinstance(origin, sender)
+
+
+@receiver(post_save, sender=Purchase)
+def add_purchase_to_shopping_cart(sender, instance, created, **kwargs):
+    """Покупки, созданные в обход UniqueLinkManager (например, в админке)."""
+    if created:
+        ShoppingCartItem.objects.add_recipe(
+            instance.recipes_id, [instance.user_id],
+        )
+
+
+@receiver(post_delete, sender=Purchase)
+def remove_purchase_from_shopping_cart(sender, instance, origin, **kwargs):
+    if deleted_directly(sender, origin):
+        ShoppingCartItem.objects.remove_recipe(
+            instance.recipes_id, [instance.user_id],
+        )
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_previous_amount(sender, instance, **kwargs):
+    instance.previous_amount = (
+        RecipeIngredient.objects.filter(pk=instance.pk).values_list(
+            'recipes_id', 'ingredients_id', 'amount',
+        ).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def update_shopping_carts(sender, instance, **kwargs):
+    """Правка состава рецепта в обход сериализатора, например в админке.
+
+    Сериализатор пишет состав через bulk_create, bulk_update и
+    ``delete_rows`` без сигналов и сам учитывает разницу в корзинах.
+    """
+    previous = getattr(instance, 'previous_amount', None)
+    current = (instance.recipes_id, instance.ingredients_id, instance.amount)
+    if previous == current:
+        return
+    if previous is not None:
+        recipe_id, ingredient_id, amount = previous
+        ShoppingCartItem.objects.add_ingredient(
+            recipe_id, ingredient_id, -amount,
+        )
+    ShoppingCartItem.objects.add_ingredient(*current)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_ingredient_from_shopping_carts(sender, instance, origin,
+                                          **kwargs):
+    if deleted_directly(sender, origin):
+        ShoppingCartItem.objects.add_ingredient(
+            instance.recipes_id, instance.ingredients_id, -instance.amount,
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Сбрасывает индекс ингредиентов во всех воркерах."""
+    transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        AuthorCounter.objects.change([instance.author_id], 'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_renditions(sender, instance, **kwargs):
+    """Нарезает размеры новой фотографии в фоне."""
+    if instance.image and (
+        instance.image_renditions.get('source') != instance.image.name
+    ):
+        schedule_renditions(instance.id)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeTag)
+def touch_recipe(sender, instance, **kwargs):
+    """Правка состава рецепта в обход сериализатора меняет updated_at."""
+    Recipe.objects.touch([instance.recipes_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    AuthorCounter.objects.change([instance.author_id], 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=Follow)
+def increment_link_counters(sender, instance, created, **kwargs):
+    """Связи, созданные в обход UniqueLinkManager (например, в админке)."""
+    if created:
+        target_id = getattr(instance, f'{sender.link_target}_id')
+        sender.change_counters([target_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_delete, sender=Follow)
+def decrement_link_counters(sender, instance, **kwargs):
+    """Связи, удаленные в обход UniqueLinkManager, в том числе каскадом."""
+    target_id = getattr(instance, f'{sender.link_target}_id')
+    sender.change_counters([target_id], -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous_image(sender, instance, **kwargs):
+    instance.previous_image = (
+        Recipe.objects.filter(pk=instance.pk).values_list(
+            'image', flat=True,
+        ).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(sender, instance, **kwargs):
+    """Переносит ссылку со старой фотографии на новую."""
+    previous = getattr(instance, 'previous_image', None)
+    if previous != instance.image.name:
+        StoredFile.objects.change([instance.image.name], 1)
+        StoredFile.objects.change([previous], -1)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image_reference(sender, instance, **kwargs):
+    StoredFile.objects.change([instance.image.name], -1)
@@ -0,0 +1,60 @@
+"""Хранилище файлов с именами по хешу содержимого."""
+import hashlib
+import posixpath
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+DIGEST_LENGTH = 32
+
+
+def short_digest(hasher):
+    return hasher.hexdigest()[:DIGEST_LENGTH]
+
+
+def content_digest(content):
+    """Хеш содержимого для имени файла."""
+    return short_digest(hashlib.sha256(content))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Один файл на одно содержимое.
+
+    Имя файла строится из хеша содержимого. Если такой файл уже есть,
+    повторная запись пропускается. Учет ссылок ведет ``StoredFile``.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        hasher = hashlib.sha256()
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        content.seek(0)
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(
+            posixpath.dirname(name), short_digest(hasher) + extension,
+        )
+        # Сначала продлевается срок у записи о файле: сборщик либо
+        # пропустит ее, либо уже удалил файл, и он запишется заново.
+        apps.get_model('recipes', 'StoredFile').objects.filter(
+            name=name,
+        ).update(updated_at=timezone.now())
+        if self.exists(name):
+            return name
+        saved = super().save(name, content, max_length)
+        if saved != name:
+            # Тот же файл успел записать параллельный запрос.
+            self.delete(saved)
+        return name
+
+
+image_storage = ContentAddressedStorage()
+
+
+def get_image_storage():
+    return image_storage
@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.tests.factories import create_recipe, create_user
+from recipes.models import Ingredient
+
+User = get_user_model()
+
+
+class ChangelistFiltersTest(TestCase):
+    """Фильтры списков в админке не читают таблицу целиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass',
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ingredient{number}', measurement_unit=unit)
+            for number, unit in enumerate(('г', 'кг', 'г', 'мл'))
+        )
+        cls.author = create_user('author')
+        create_recipe(cls.author, name='mine')
+        create_recipe(create_user('other'), name='theirs')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def test_ingredient_unit_filter(self):
+        url = '/admin/recipes/ingredient/'
+        response, queries = self.get(url)
+        self.assertFalse(
+            [sql for sql in queries if 'DISTINCT' in sql.upper()],
+        )
+        self.assertContains(response, 'name="measurement_unit"')
+        response, _ = self.get(url, measurement_unit='г')
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_recipe_author_filter(self):
+        url = '/admin/recipes/recipe/'
+        response, _ = self.get(url, author_id=self.author.id)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response, _ = self.get(url, author_id='abc')
+        self.assertEqual(response.context['cl'].result_count, 2)
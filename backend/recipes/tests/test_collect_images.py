@@ -0,0 +1,66 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from recipes.management.commands.collect_images import Command
+from recipes.models import StoredFile
+from recipes.storage import image_storage
+
+CONTENT = b'recipe image'
+
+
+class CollectImagesTest(TestCase):
+    """collect_images не удаляет файлы, на которые снова сослались."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.name = image_storage.save(
+            'recipes/image.jpg', ContentFile(CONTENT),
+        )
+        StoredFile.objects.create(name=self.name)
+        self.release()
+
+    def release(self):
+        """Запись без ссылок старше срока, после которого файл удаляется."""
+        StoredFile.objects.filter(name=self.name).update(
+            updated_at=timezone.now() - timedelta(days=1),
+        )
+
+    def collect(self):
+        call_command('collect_images', stdout=StringIO())
+
+    def test_removes_released_file(self):
+        self.collect()
+        self.assertFalse(image_storage.exists(self.name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_keeps_file_referenced_during_collection(self):
+        release = Command.release
+
+        def referenced_first(command, name):
+            StoredFile.objects.change([name], 1)
+            release(command, name)
+
+        with mock.patch.object(
+            Command, 'release', autospec=True, side_effect=referenced_first,
+        ):
+            self.collect()
+        self.assertTrue(image_storage.exists(self.name))
+        self.assertEqual(StoredFile.objects.get().refcount, 1)
+
+    def test_upload_of_same_content_keeps_file(self):
+        name = image_storage.save('recipes/other.jpg', ContentFile(CONTENT))
+        self.assertEqual(name, self.name)
+        self.collect()
+        self.assertTrue(image_storage.exists(self.name))
+        self.assertTrue(StoredFile.objects.exists())
@@ -0,0 +1,64 @@
+import csv
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+
+from recipes.models import Ingredient, Tag
+
+
+class ImportDataCopyTest(TestCase):
+    """import_data --copy грузит файлы через COPY только в PostgreSQL."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.ingredients = os.path.join(directory.name, 'ingredients.csv')
+        self.tags = os.path.join(directory.name, 'tags.csv')
+        with open(self.ingredients, 'w', newline='') as file:
+            csv.writer(file).writerows([
+                ('Мука', 'г'),
+                ('Соль', 'г'),
+                ('Мука', 'г'),
+            ])
+        with open(self.tags, 'w', newline='') as file:
+            csv.writer(file).writerows([
+                ('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+                ('Утро', '#8775D2', 'breakfast'),
+            ])
+
+    def run_import(self):
+        call_command(
+            'import_data', 'ingredients', 'tags',
+            ingredients=[self.ingredients],
+            tags=[self.tags],
+            copy=True,
+            stdout=StringIO(),
+        )
+
+    def test_copy_merges_rows(self):
+        Tag.objects.create(name='Старый', color='#000000', slug='lunch')
+        self.run_import()
+        self.run_import()
+        self.assertQuerySetEqual(
+            Ingredient.objects.order_by('name'),
+            [('Мука', 'г'), ('Соль', 'г')],
+            transform=lambda item: (item.name, item.measurement_unit),
+        )
+        self.assertQuerySetEqual(
+            Tag.objects.order_by('slug'),
+            [('breakfast', 'Утро'), ('lunch', 'Обед')],
+            transform=lambda tag: (tag.slug, tag.name),
+        )
+
+    def test_copy_requires_postgresql(self):
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            with self.assertRaisesMessage(CommandError, 'PostgreSQL'):
+                self.run_import()
+        self.assertFalse(Ingredient.objects.exists())
@@ -0,0 +1,79 @@
+from django.db import connection
+from django.test import TestCase
+
+from api.tests.factories import (create_ingredients, create_reader_and_author,
+                                 create_recipe, create_tags)
+from recipes.models import (Favorite, Follow, Purchase, RecipeIngredient,
+                            RecipeTag)
+
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+class HotQueriesIndexTest(TestCase):
+    """Горячие запросы связей обслуживаются индексами.
+
+    Таблицы в тестах маленькие, поэтому последовательное чтение
+    запрещается: если подходящего индекса нет, в плане останется
+    Seq Scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = create_reader_and_author()
+        cls.recipe = create_recipe(
+            cls.author, ingredients=create_ingredients(1), tags=create_tags(1),
+        )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assert_index_scan(self, queryset, index_name=None):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(scan in plan for scan in INDEX_SCANS), msg=plan,
+        )
+        if index_name:
+            self.assertIn(index_name, plan)
+        return plan
+
+    def test_link_lookups(self):
+        cases = (
+            (Favorite.objects.filter(user=self.user, recipes=self.recipe),
+             'unique_favorite_user_recipes'),
+            (Purchase.objects.filter(user=self.user, recipes=self.recipe),
+             'unique_purchase_user_recipes'),
+            (Follow.objects.filter(user=self.user, following=self.author),
+             'unique_following_user_following'),
+        )
+        for queryset, index_name in cases:
+            with self.subTest(model=queryset.model.__name__):
+                self.assert_index_scan(queryset, index_name)
+
+    def test_user_links(self):
+        """Связи пользователя целиком, из них собирается кэш флагов."""
+        cases = (
+            (Favorite, 'recipes_id'),
+            (Purchase, 'recipes_id'),
+            (Follow, 'following_id'),
+        )
+        for model, field in cases:
+            with self.subTest(model=model.__name__):
+                self.assert_index_scan(
+                    model.objects.filter(user=self.user).values_list(
+                        field, flat=True,
+                    ),
+                )
+
+    def test_prefetches(self):
+        """Состав и теги рецептов догружаются по индексу, без сортировки."""
+        cases = (
+            (RecipeIngredient.objects.filter(recipes__in=[self.recipe.id]),
+             'unique_recipeingredient_recipes_ingredients'),
+            (RecipeTag.objects.filter(recipes__in=[self.recipe.id]),
+             'unique_recipetag_recipes_tags'),
+        )
+        for queryset, index_name in cases:
+            with self.subTest(model=queryset.model.__name__):
+                plan = self.assert_index_scan(queryset, index_name)
+                self.assertNotIn('Sort', plan)
@@ -0,0 +1,215 @@
+"""Потоковые выгрузка и загрузка рецептов в формате NDJSON.
+
+Одна строка файла - один рецепт::
+
+    {"author": "username", "name": "...", "text": "...",
+     "cooking_time": 10, "image": "recipes/photo.jpg",
+     "tags": ["breakfast"],
+     "ingredients": [{"name": "соль", "measurement_unit": "г",
+                      "amount": 5}]}
+"""
+import json
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+
+from .loaders import batched
+from .models import (AuthorCounter, Ingredient, Recipe, RecipeIngredient,
+                     RecipeTag, StoredFile, Tag, User)
+
+BATCH_SIZE = 1000
+
+
+def check_range(model, field_name, *values):
+    """Значения целочисленного поля в пределах его типа в базе."""
+    low, high = connection.ops.integer_field_range(
+        model._meta.get_field(field_name).get_internal_type(),
+    )
+    for value in values:
+        if (low is not None and value < low) or (
+            high is not None and value > high
+        ):
+            raise ValueError(f'{field_name} вне диапазона: {value}')
+
+
+def check_string(model, field_name, value):
+    """Непустая строка не длиннее max_length поля."""
+    max_length = model._meta.get_field(field_name).max_length
+    if not isinstance(value, str) or not value or (
+        max_length is not None and len(value) > max_length
+    ):
+        raise ValueError(
+            f'{field_name} должен быть непустой строкой'
+            + (f' до {max_length} символов' if max_length else '')
+        )
+
+
+def export_recipes(queryset, batch_size=BATCH_SIZE):
+    """Строки NDJSON для рецептов queryset, читает их пачками по id."""
+    ingredients = {
+        ingredient_id: (name, measurement_unit)
+        for ingredient_id, name, measurement_unit
+        in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit',
+        ).iterator()
+    }
+    tags = dict(Tag.objects.values_list('id', 'slug'))
+    queryset = queryset.order_by('id').values(
+        'id', 'author__username', 'name', 'text', 'cooking_time', 'image',
+    )
+    last_id = 0
+    while batch := list(queryset.filter(id__gt=last_id)[:batch_size]):
+        last_id = batch[-1]['id']
+        recipe_ids = [recipe['id'] for recipe in batch]
+        recipe_ingredients = defaultdict(list)
+        for recipe_id, ingredient_id, amount in (
+            RecipeIngredient.objects.filter(recipes_id__in=recipe_ids)
+            .order_by('id')
+            .values_list('recipes_id', 'ingredients_id', 'amount')
+        ):
+            name, measurement_unit = ingredients[ingredient_id]
+            recipe_ingredients[recipe_id].append({
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            })
+        recipe_tags = defaultdict(list)
+        for recipe_id, tag_id in (
+            RecipeTag.objects.filter(recipes_id__in=recipe_ids)
+            .order_by('id')
+            .values_list('recipes_id', 'tags_id')
+        ):
+            recipe_tags[recipe_id].append(tags[tag_id])
+        for recipe in batch:
+            yield json.dumps(
+                {
+                    'author': recipe['author__username'],
+                    'name': recipe['name'],
+                    'text': recipe['text'],
+                    'cooking_time': recipe['cooking_time'],
+                    'image': recipe['image'] or None,
+                    'tags': recipe_tags[recipe['id']],
+                    'ingredients': recipe_ingredients[recipe['id']],
+                },
+                ensure_ascii=False,
+            ) + '\n'
+
+
+class RecipeImporter:
+    """Пакетная загрузка рецептов из потока словарей.
+
+    Принимает пары (номер строки, строка NDJSON). Внешние ключи
+    разрешаются по словарям, собранным один раз при создании
+    загрузчика. Рецепт, у которого автор уже имеет рецепт с таким же
+    названием, пропускается, о строках с ошибками, в том числе
+    с некорректным JSON, сообщается через ``on_error(номер строки, текст)``.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, on_error=None):
+        self.batch_size = batch_size
+        self.on_error = on_error
+        self.users = dict(User.objects.values_list('username', 'id'))
+        self.ingredients = {
+            (name, measurement_unit): ingredient_id
+            for ingredient_id, name, measurement_unit
+            in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit',
+            ).iterator()
+        }
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.created = 0
+        self.existing = 0
+        self.invalid = 0
+
+    def run(self, lines):
+        for batch in batched(lines, self.batch_size):
+            self.import_batch(batch)
+
+    def resolve(self, line):
+        """Рецепт и id его ингредиентов и тегов или ValueError."""
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError('ожидается объект JSON')
+        try:
+            author_id = self.users[record['author']]
+        except KeyError:
+            raise ValueError(
+                f'неизвестный автор {record.get("author")}'
+            ) from None
+        amounts = Counter()
+        for item in record.get('ingredients') or []:
+            key = (item['name'], item['measurement_unit'])
+            if key not in self.ingredients:
+                raise ValueError(f'неизвестный ингредиент {key}')
+            amounts[self.ingredients[key]] += int(item['amount'])
+        check_range(RecipeIngredient, 'amount', *amounts.values())
+        tag_ids = set()
+        for slug in record.get('tags') or []:
+            if slug not in self.tags:
+                raise ValueError(f'неизвестный тег {slug}')
+            tag_ids.add(self.tags[slug])
+        if not amounts or min(amounts.values()) < 1:
+            raise ValueError('нужен хотя бы один ингредиент с amount >= 1')
+        if int(record['cooking_time']) < 1:
+            raise ValueError('cooking_time должен быть >= 1')
+        check_range(Recipe, 'cooking_time', int(record['cooking_time']))
+        check_string(Recipe, 'name', record['name'])
+        if record.get('text') is not None:
+            check_string(Recipe, 'text', record['text'])
+        if record.get('image'):
+            check_string(Recipe, 'image', record['image'])
+        recipe = Recipe(
+            author_id=author_id,
+            name=record['name'],
+            text=record.get('text'),
+            cooking_time=record['cooking_time'],
+            image=record.get('image') or None,
+        )
+        return recipe, amounts, tag_ids
+
+    def import_batch(self, lines):
+        resolved = []
+        for number, line in lines:
+            try:
+                resolved.append(self.resolve(line))
+            except (KeyError, TypeError, ValueError) as error:
+                self.invalid += 1
+                if self.on_error:
+                    self.on_error(number, str(error))
+        existing = set(Recipe.objects.filter(
+            author_id__in={recipe.author_id for recipe, _, _ in resolved},
+            name__in={recipe.name for recipe, _, _ in resolved},
+        ).values_list('author_id', 'name'))
+        new = []
+        for recipe, amounts, tag_ids in resolved:
+            key = (recipe.author_id, recipe.name)
+            if key in existing:
+                self.existing += 1
+                continue
+            existing.add(key)
+            new.append((recipe, amounts, tag_ids))
+        if not new:
+            return
+        with transaction.atomic():
+            Recipe.objects.bulk_create([recipe for recipe, _, _ in new])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipes=recipe,
+                    ingredients_id=ingredient_id,
+                    amount=amount,
+                )
+                for recipe, amounts, _ in new
+                for ingredient_id, amount in amounts.items()
+            ])
+            RecipeTag.objects.bulk_create([
+                RecipeTag(recipes=recipe, tags_id=tag_id)
+                for recipe, _, tag_ids in new
+                for tag_id in tag_ids
+            ])
+            AuthorCounter.objects.change(
+                [recipe.author_id for recipe, _, _ in new], 'recipes_count', 1,
+            )
+            StoredFile.objects.change(
+                [recipe.image.name for recipe, _, _ in new], 1,
+            )
+        self.created += len(new)
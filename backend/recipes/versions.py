@@ -0,0 +1,21 @@
+"""Счетчики версий в общем кэше для сброса данных во всех воркерах."""
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Текущая версия, при первом обращении - время в наносекундах."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Увеличивает версию, данные под прежней версией перестают читаться."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)